@@ -1,9 +1,112 @@
+import atexit
+import os
+import random
+import threading
+import time
+
 from flask import Flask
 import redis
 
 app = Flask(__name__)
 r= redis.Redis(host='redis', port=6379)
 
+# Hits are counted in memory and pushed to Redis with INCRBY every
+# FLUSH_INTERVAL seconds, or as soon as FLUSH_THRESHOLD hits are pending.
+FLUSH_INTERVAL = float(os.getenv('COUNTER_FLUSH_INTERVAL', 0.1))
+FLUSH_THRESHOLD = int(os.getenv('COUNTER_FLUSH_THRESHOLD', 1000))
+# COUNTER_SHARDS=n spreads the count over visits:0..visits:n-1 (summed on read)
+# so no single key is hot; 0 keeps the one 'visits' key.
+SHARDS = int(os.getenv('COUNTER_SHARDS', 0))
+# The displayed total is never older than this many seconds
+MAX_STALENESS = float(os.getenv('COUNTER_MAX_STALENESS', 1.0))
+
+
+class VisitCounter:
+    def __init__(self, client, key='visits', shards=0):
+        self.client = client
+        self.key = key
+        # The plain key is always part of the sum, so turning sharding on keeps the old count
+        self.keys = [key] + [f'{key}:{n}' for n in range(shards)]
+        self.shards = shards
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pending = 0
+        self._inflight = 0
+        self._total = None
+        self._read_at = 0.0
+        self._pid = None
+
+    def _ensure_flusher(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    threading.Thread(target=self._run, name='visit-flusher', daemon=True).start()
+
+    def hit(self):
+        """Count one visit and return the total to display."""
+        self._ensure_flusher()
+        with self._lock:
+            self._pending += 1
+            if self._pending >= FLUSH_THRESHOLD:
+                self._wake.set()
+            fresh = self._total is not None and time.monotonic() - self._read_at < MAX_STALENESS
+            if fresh:
+                return self._total + self._inflight + self._pending
+        # Cold start or the flusher has fallen behind: read Redis directly
+        total = self._read_total()
+        with self._lock:
+            self._store_total(total)
+            return self._total + self._inflight + self._pending
+
+    def _read_total(self):
+        return sum(int(value or 0) for value in self.client.mget(self.keys))
+
+    def _store_total(self, total):
+        # Caller holds the lock
+        self._total = total
+        self._read_at = time.monotonic()
+
+    def flush(self):
+        with self._lock:
+            amount, self._pending = self._pending, 0
+            self._inflight = amount
+            stale_soon = time.monotonic() - self._read_at >= MAX_STALENESS / 2
+        if not amount and not stale_soon:
+            return
+        try:
+            if self.shards:
+                pipe = self.client.pipeline(transaction=False)
+                if amount:
+                    pipe.incrby(random.choice(self.keys[1:]), amount)
+                pipe.mget(self.keys)
+                total = sum(int(value or 0) for value in pipe.execute()[-1])
+            elif amount:
+                # INCRBY returns the new total, so this refreshes the cache for free
+                total = self.client.incrby(self.key, amount)
+            else:
+                total = self._read_total()
+        except redis.RedisError as e:
+            app.logger.warning('Flushing %d visits failed, will retry: %s', amount, e)
+            with self._lock:
+                self._pending += amount
+                self._inflight = 0
+            return
+        with self._lock:
+            self._inflight = 0
+            self._store_total(total)
+
+    def _run(self):
+        while True:
+            self._wake.wait(FLUSH_INTERVAL)
+            self._wake.clear()
+            self.flush()
+
+
+visits = VisitCounter(r, shards=SHARDS)
+# Push whatever is still pending when the process exits cleanly
+atexit.register(visits.flush)
+
 app.route('/')
 def hello():
     return f'Hello World!'
@@ -11,10 +114,8 @@ def hello():
 
 @app.route('/count')
 def count():
-   count = r.incr('visits')
+   count = visits.hit()
    return f'This page has been visited {count} times.'
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=4002)
-
-    
\ No newline at end of file
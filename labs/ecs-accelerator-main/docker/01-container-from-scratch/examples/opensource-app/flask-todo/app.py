@@ -1,26 +1,129 @@
-from flask import Flask, render_template_string, request, redirect
+import os
+import sqlite3
+import threading
+
+from flask import Flask, jsonify, request, redirect
 
 app = Flask(__name__)
-tasks = []
+
+# TODO_STORAGE=memory (default) keeps tasks in the process; TODO_STORAGE=sqlite
+# keeps them in TODO_DB so they survive restarts and are shared by workers.
+TODO_STORAGE = os.getenv("TODO_STORAGE", "memory")
+TODO_DB = os.getenv("TODO_DB", "todo.db")
+PAGE_SIZE = int(os.getenv("TODO_PAGE_SIZE", 50))
+MAX_PAGE_SIZE = 500
+MAX_BATCH = int(os.getenv("TODO_MAX_BATCH", 10000))
+
+
+class MemoryStore:
+    """Tasks in a list; a task's id is its position + 1, so pages are slices."""
+
+    def __init__(self):
+        self._tasks = []
+        self._lock = threading.Lock()
+
+    def add_many(self, texts):
+        with self._lock:
+            first = len(self._tasks) + 1
+            self._tasks.extend(texts)
+        return list(range(first, first + len(texts)))
+
+    def page(self, after=0, limit=PAGE_SIZE):
+        # One extra row tells the caller whether there is a next page
+        with self._lock:
+            chunk = self._tasks[after:after + limit + 1]
+        return [(after + i + 1, text) for i, text in enumerate(chunk)]
+
+
+class SqliteStore:
+    """Tasks in SQLite (WAL mode), one connection per thread."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS tasks (id INTEGER PRIMARY KEY, text TEXT NOT NULL)")
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            # WAL lets readers carry on while a writer commits
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def add_many(self, texts):
+        conn = self._connection()
+        with conn:
+            # Take the write lock before reading MAX(id); otherwise concurrent
+            # writers read the same value and hand out the same ids
+            conn.execute("BEGIN IMMEDIATE")
+            cur = conn.execute("SELECT COALESCE(MAX(id), 0) FROM tasks")
+            first = cur.fetchone()[0] + 1
+            conn.executemany("INSERT INTO tasks (id, text) VALUES (?, ?)",
+                             ((first + i, text) for i, text in enumerate(texts)))
+        return list(range(first, first + len(texts)))
+
+    def page(self, after=0, limit=PAGE_SIZE):
+        # Keyset pagination on the primary key: cost does not grow with `after`
+        cur = self._connection().execute(
+            "SELECT id, text FROM tasks WHERE id > ? ORDER BY id LIMIT ?", (after, limit + 1))
+        return cur.fetchall()
+
+
+store = SqliteStore(TODO_DB) if TODO_STORAGE == "sqlite" else MemoryStore()
+
+# Compiled once at import instead of on every request
+PAGE = app.jinja_env.from_string("""
+    <h2>Todo List</h2>
+    <form method='POST'>
+        <input name='task'> <button>Add</button>
+    </form>
+    <ul>
+    {% for id, t in tasks %}
+        <li>{{ t }}</li>
+    {% endfor %}
+    </ul>
+    {% if next_after %}<a href='/?after={{ next_after }}'>Next page</a>{% endif %}
+""")
+
+
+def read_page():
+    """Page of tasks from ?after=&limit=, plus the `after` for the next page (or None)."""
+    after = max(request.args.get("after", 0, type=int), 0)
+    limit = min(max(request.args.get("limit", PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    rows = store.page(after, limit)
+    next_after = rows[limit - 1][0] if len(rows) > limit else None
+    return rows[:limit], next_after
+
 
 @app.get("/")
 def home():
-    return render_template_string("""
-        <h2>Todo List</h2>
-        <form method='POST'>
-            <input name='task'> <button>Add</button>
-        </form>
-        <ul>
-        {% for t in tasks %}
-            <li>{{ t }}</li>
-        {% endfor %}
-        </ul>
-    """)
+    tasks, next_after = read_page()
+    return PAGE.render(tasks=tasks, next_after=next_after)
 
 @app.post("/")
 def add():
-    tasks.append(request.form['task'])
+    store.add_many([request.form['task']])
     return redirect("/")
 
+@app.get("/api/tasks")
+def list_tasks():
+    tasks, next_after = read_page()
+    return jsonify({"tasks": [{"id": id, "text": text} for id, text in tasks], "next_after": next_after})
+
+@app.post("/api/tasks")
+def add_tasks():
+    """Bulk add: {"tasks": ["a", "b", ...]}"""
+    body = request.get_json(silent=True)
+    texts = body.get("tasks") if isinstance(body, dict) else None
+    if not isinstance(texts, list) or not texts or not all(isinstance(t, str) for t in texts):
+        return jsonify({"error": "expected {\"tasks\": [\"...\", ...]}"}), 400
+    if len(texts) > MAX_BATCH:
+        return jsonify({"error": f"at most {MAX_BATCH} tasks per request"}), 413
+    return jsonify({"ids": store.add_many(texts)}), 201
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=8000)
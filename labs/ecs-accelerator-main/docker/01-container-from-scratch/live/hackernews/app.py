@@ -1,25 +1,167 @@
-from flask import Flask, jsonify
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from flask import Flask, jsonify, request
 import requests
+from requests.adapters import HTTPAdapter
 
 app = Flask(__name__)
 
+# Point HN_API_BASE at fake_upstream.py to run without the real API
+HN_API_BASE = os.getenv('HN_API_BASE', 'https://hacker-news.firebaseio.com/v0').rstrip('/')
+HN_TIMEOUT = float(os.getenv('HN_TIMEOUT', 5))
+HN_LIST_TTL = float(os.getenv('HN_LIST_TTL', 10))
+HN_ITEM_TTL = float(os.getenv('HN_ITEM_TTL', 60))
+# How long past fetch time a stale value may still be served if upstream is down
+HN_MAX_STALE = float(os.getenv('HN_MAX_STALE', 600))
+# Minimum gap between background retries after a failed refresh
+HN_RETRY_INTERVAL = float(os.getenv('HN_RETRY_INTERVAL', 5))
+HN_EXPAND_WORKERS = int(os.getenv('HN_EXPAND_WORKERS', 10))
+HN_REFRESH_WORKERS = int(os.getenv('HN_REFRESH_WORKERS', 4))
+STORY_COUNT = 10
+
+# One keep-alive session per worker process: connections (and their TLS
+# handshakes) are reused across requests instead of opened per call
+session = requests.Session()
+pool_size = HN_EXPAND_WORKERS + HN_REFRESH_WORKERS
+session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+
+# Bounded pool for ?expand=1 item lookups, shared by all requests
+expand_pool = ThreadPoolExecutor(max_workers=HN_EXPAND_WORKERS, thread_name_prefix='hn-item')
+# Background (stale-while-revalidate) refreshes run here
+refresh_pool = ThreadPoolExecutor(max_workers=HN_REFRESH_WORKERS, thread_name_prefix='hn-refresh')
+
+
+class Document:
+    """An upstream JSON body plus the validators needed to revalidate it."""
+    __slots__ = ('value', 'etag', 'last_modified', 'fetched_at')
+
+    def __init__(self, value, etag=None, last_modified=None):
+        self.value = value
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = time.monotonic()
+
+
+def fetch_document(path, previous=None):
+    """GET an upstream path, conditionally if we already hold a copy."""
+    headers = {}
+    if previous is not None:
+        if previous.etag:
+            headers['If-None-Match'] = previous.etag
+        if previous.last_modified:
+            headers['If-Modified-Since'] = previous.last_modified
+    response = session.get(f'{HN_API_BASE}/{path}', headers=headers, timeout=HN_TIMEOUT)
+    if response.status_code == 304 and previous is not None:
+        return Document(previous.value, previous.etag, previous.last_modified)
+    response.raise_for_status()
+    return Document(response.json(), response.headers.get('ETag'), response.headers.get('Last-Modified'))
+
+
+class RefreshingCache:
+    """
+    Stale-while-revalidate cache for upstream documents.
+
+    - younger than `ttl`: served as is ('fresh')
+    - older, but younger than `max_stale`: served immediately while a single
+      background refresh runs ('stale')
+    - missing or older than `max_stale`: the caller waits for a fetch ('miss')
+
+    Concurrent callers for the same path share one in-flight fetch, so an
+    expiry never turns into a burst of upstream requests. After a failed
+    refresh, stale values keep being served and the upstream is retried at
+    most every `retry_interval` seconds.
+    """
+
+    def __init__(self, ttl, max_stale=HN_MAX_STALE, retry_interval=HN_RETRY_INTERVAL):
+        self.ttl = ttl
+        self.max_stale = max(max_stale, ttl)
+        self.retry_interval = retry_interval
+        self._entries = {}
+        self._inflight = {}
+        self._failed_at = {}
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        """Returns (value, state); raises if nothing usable can be fetched."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(path)
+            age = now - entry.fetched_at if entry is not None else None
+            if entry is not None and age < self.ttl:
+                return entry.value, 'fresh'
+            usable = entry is not None and age < self.max_stale
+            future = self._inflight.get(path)
+            backing_off = now - self._failed_at.get(path, float('-inf')) < self.retry_interval
+            leader = future is None and not (usable and backing_off)
+            if leader:
+                future = self._inflight[path] = Future()
+        if usable:
+            if leader:
+                refresh_pool.submit(self._refresh, path, entry, future)
+            return entry.value, 'stale'
+        if leader:
+            # Misses fetch on the caller's own thread; followers wait on its future
+            self._refresh(path, entry, future)
+        return future.result().value, 'miss'
+
+    def _refresh(self, path, previous, future):
+        try:
+            entry = fetch_document(path, previous)
+        except Exception as e:
+            with self._lock:
+                self._failed_at[path] = time.monotonic()
+                self._inflight.pop(path, None)
+            app.logger.warning("Refreshing %s failed: %s", path, e)
+            future.set_exception(e)
+            return
+        with self._lock:
+            self._entries[path] = entry
+            self._failed_at.pop(path, None)
+            self._inflight.pop(path, None)
+        future.set_result(entry)
+
+
+list_cache = RefreshingCache(HN_LIST_TTL)
+item_cache = RefreshingCache(HN_ITEM_TTL)
+
+
+def fetch_item(item_id):
+    try:
+        return item_cache.get(f'item/{item_id}.json')[0]
+    except Exception as e:
+        return {"id": item_id, "error": str(e)}
+
+
+def stories(feed, key):
+    try:
+        ids, state = list_cache.get(f'{feed}.json')
+    except Exception as e:
+        return jsonify({"error": f"upstream request failed: {e}"}), 502
+    ids = ids[:STORY_COUNT]
+    if request.args.get('expand') == '1':
+        # Latency is the slowest item, not the sum of all of them
+        response = jsonify({key: list(expand_pool.map(fetch_item, ids))})
+    else:
+        response = jsonify({key: ids})
+    response.headers['X-Cache'] = state
+    return response
+
+
 @app.route('/')
 def home():
     return jsonify({"message": "HN API Wrapper", "endpoints": ["/top", "/latest"]})
 
 @app.route('/top')
 def top_stories():
-    url = "https://hacker-news.firebaseio.com/v0/topstories.json"
-    response = requests.get(url)
-    story_ids = response.json()[:10]  # Get top 10
-    return jsonify({"top_stories": story_ids})
+    return stories('topstories', 'top_stories')
 
 @app.route('/latest')
 def latest_stories():
-    url = "https://hacker-news.firebaseio.com/v0/newstories.json"
-    response = requests.get(url)
-    story_ids = response.json()[:10]
-    return jsonify({"latest_stories": story_ids})
+    return stories('newstories', 'latest_stories')
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,86 @@
+"""
+Local stand-in for the Hacker News API, for trying the wrapper offline.
+
+    python fake_upstream.py --port 8081 --latency 0.2
+    HN_API_BASE=http://localhost:8081/v0 python app.py
+
+Serves /v0/topstories.json, /v0/newstories.json and /v0/item/<id>.json, each
+after --latency seconds, and logs one line per request so you can see what
+the wrapper actually sends upstream. The story lists change every --rotate
+seconds; responses carry ETag/Last-Modified and conditional requests get a
+304 while nothing changed. --fail-rate makes that share of requests fail
+with a 503, to watch the wrapper ride out a flapping upstream.
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ITEM_PATH = re.compile(r'^/v0/item/(\d+)\.json$')
+
+
+class Handler(BaseHTTPRequestHandler):
+    latency = 0.0
+    rotate = 30.0
+    fail_rate = 0.0
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        if random.random() < self.fail_rate:
+            self.send_error(503)
+            return
+        # Everything changes on the same clock, in steps of --rotate seconds
+        epoch = int(time.time() // self.rotate * self.rotate)
+        shift = epoch // int(self.rotate) % 50
+        if self.path == '/v0/topstories.json':
+            body = list(range(1000 + shift, 1500))
+        elif self.path == '/v0/newstories.json':
+            body = list(range(2499, 1999 + shift, -1))
+        elif ITEM_PATH.match(self.path):
+            item_id = int(ITEM_PATH.match(self.path).group(1))
+            body = {"id": item_id, "type": "story", "by": "fake", "score": (item_id + shift) % 97,
+                    "title": f"Story {item_id}", "time": epoch}
+        else:
+            self.send_error(404)
+            return
+        payload = json.dumps(body).encode()
+        etag = '"%s"' % hashlib.sha1(payload).hexdigest()[:16]
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', formatdate(epoch, usegmt=True))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Hacker News API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds to wait before every response")
+    parser.add_argument('--rotate', type=float, default=30.0, help="seconds between changes to the data")
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="fraction of requests answered with 503")
+    args = parser.parse_args()
+
+    Handler.latency = args.latency
+    Handler.rotate = args.rotate
+    Handler.fail_rate = args.fail_rate
+    # HTTP/1.1 so the wrapper's keep-alive connections are actually reused
+    Handler.protocol_version = 'HTTP/1.1'
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    print(f"Fake HN API on http://{args.host}:{args.port}/v0 (latency {args.latency}s)")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
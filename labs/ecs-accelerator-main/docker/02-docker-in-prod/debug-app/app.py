@@ -1,36 +1,122 @@
 # app.py
-import logging
 import os
-import sys
+
+# SERVER_MODE=gevent runs each request on a greenlet instead of an OS thread,
+# so a sleeping /slow costs a few KB rather than a worker thread. Patching has
+# to happen before anything else imports socket/threading.
+SERVER_MODE = os.getenv('SERVER_MODE', 'threaded')
+if SERVER_MODE == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+
+import base64
+import fnmatch
+import functools
+import hmac
+import itertools
+import json
+import logging
+import math
 import time
 import random
-from flask import Flask, jsonify, request
+import threading
+import uuid
+from flask import Flask, Response, abort, g, jsonify, request
+
+import logs
+import profiling
+from metrics import CONTENT_TYPE, SharedMetrics
 
 app = Flask(__name__)
 
-# Configure logging to stdout
-logging.basicConfig(
+# JSON lines to stdout through a background writer (see logs.py)
+log_handler = logs.configure(
     level=os.getenv('LOG_LEVEL', 'INFO'),
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[logging.StreamHandler(sys.stdout)]
+    sample_rates=logs.parse_sample_rates(os.getenv('LOG_SAMPLE_RATES')),
+    default_rate=float(os.getenv('LOG_SAMPLE_RATE', 1)),
+    queue_size=int(os.getenv('LOG_QUEUE_SIZE', 10000)),
+    on_drop=lambda: get_metrics().inc('log_dropped'),
 )
+# The access log in record_request replaces werkzeug's own request lines
+logging.getLogger('werkzeug').setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
 # Simulated state
 start_time = time.time()
-request_count = 0
-error_count = 0
+
+# /slow guard rails
+SLOW_MAX_DELAY = float(os.getenv('SLOW_MAX_DELAY', 30))
+SLOW_CONCURRENCY = int(os.getenv('SLOW_CONCURRENCY', 4))
+SLOW_QUEUE_TIMEOUT = float(os.getenv('SLOW_QUEUE_TIMEOUT', 1))
+
+# /files
+FILES_ROOT = os.getenv('FILES_ROOT', '/app')
+FILES_MAX_DEPTH = int(os.getenv('FILES_MAX_DEPTH', 10))
+FILES_MAX_LIMIT = int(os.getenv('FILES_MAX_LIMIT', 10000))
+
+# Profiling is off unless PROFILE_TOKEN is set; callers send it as X-Debug-Token
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN', '')
+PROFILE_MAX_SECONDS = float(os.getenv('PROFILE_MAX_SECONDS', 60))
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', 0.005))
+_sampler_lock = threading.Lock()
+_request_profile_lock = threading.Lock()
+
+# Counters and per-route latency, shared by all worker processes (see metrics.py).
+# Built on first use so every route is registered by then.
+_metrics = None
+_metrics_lock = threading.Lock()
+
+def get_metrics():
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                routes = sorted({rule.rule for rule in app.url_map.iter_rules()
+                                 if rule.endpoint != 'static'}) + ['other']
+                _metrics = SharedMetrics(routes, counters={'requests': 'Hits on /',
+                                                   'errors': 'Hits on /crash',
+                                                   'rejected': 'Requests shed by a concurrency limit',
+                                                   'log_dropped': 'Log records dropped because the log queue was full'},
+                                         path=os.getenv('METRICS_FILE'),
+                                         slots=int(os.getenv('METRICS_SLOTS', 64)))
+    return _metrics
+
+def limit_concurrency(limit, queue_timeout):
+    """
+    Let at most `limit` requests into the route at once. Extra requests wait up
+    to `queue_timeout` seconds for a free slot, then get a 503 with Retry-After,
+    so a slow route sheds load instead of starving /health of workers.
+    """
+    def decorate(view):
+        slots = threading.BoundedSemaphore(limit)
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not slots.acquire(timeout=queue_timeout):
+                get_metrics().inc('rejected')
+                logger.warning("%s at its concurrency limit (%d) - rejecting", request.path, limit)
+                response = jsonify({"error": "too many concurrent requests", "limit": limit})
+                response.status_code = 503
+                response.headers['Retry-After'] = str(max(1, math.ceil(queue_timeout)))
+                return response
+            try:
+                return view(*args, **kwargs)
+            finally:
+                slots.release()
+        return wrapper
+    return decorate
 
 @app.route('/')
 def home():
-    global request_count
-    request_count += 1
-    logger.info(f"Home endpoint hit - Request #{request_count}")
+    metrics = get_metrics()
+    metrics.inc('requests')
+    request_count = metrics.value('requests')
+    logger.info("Home endpoint hit - Request #%d", request_count)
     return jsonify({
         "message": "Demo Docker Debugging App",
         "uptime": f"{int(time.time() - start_time)}s",
         "requests": request_count,
-        "errors": error_count
+        "errors": metrics.value('errors')
     })
 
 @app.route('/health')
@@ -49,16 +135,24 @@ def health():
 @app.route('/crash')
 def crash():
     """Endpoint that causes a crash"""
-    global error_count
-    error_count += 1
+    get_metrics().inc('errors')
     logger.error("Crash endpoint triggered - about to raise exception")
     raise Exception("Intentional crash for debugging demo")
 
 @app.route('/slow')
 def slow():
-    """Slow endpoint"""
-    delay = int(request.args.get('delay', 5))
-    logger.warning(f"Slow endpoint - sleeping for {delay}s")
+    """Slow endpoint, capped at SLOW_MAX_DELAY seconds"""
+    try:
+        delay = float(request.args.get('delay', 5))
+    except ValueError:
+        return jsonify({"error": "delay must be a number"}), 400
+    if not 0 <= delay <= SLOW_MAX_DELAY:
+        return jsonify({"error": f"delay must be between 0 and {SLOW_MAX_DELAY:g}s"}), 400
+    return sleep_for(int(delay) if delay.is_integer() else delay)
+
+@limit_concurrency(SLOW_CONCURRENCY, SLOW_QUEUE_TIMEOUT)
+def sleep_for(delay):
+    logger.warning("Slow endpoint - sleeping for %ss", delay)
     time.sleep(delay)
     logger.info("Slow endpoint completed")
     return jsonify({"message": f"Slept for {delay}s"})
@@ -72,24 +166,220 @@ def show_env():
                 if not any(secret in k.lower() for secret in ['password', 'secret', 'key', 'token'])}
     return jsonify(safe_env)
 
+def encode_cursor(state):
+    raw = json.dumps(state, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+    state = json.loads(raw)
+    if not isinstance(state, dict):
+        raise ValueError('cursor is not an object')
+    return state
+
+def entry_type(entry):
+    if entry.is_symlink():
+        return 'symlink'
+    if entry.is_dir(follow_symlinks=False):
+        return 'dir'
+    if entry.is_file(follow_symlinks=False):
+        return 'file'
+    return 'other'
+
+def walk(root, max_depth, prefix='', after=(), depth=0):
+    """
+    Depth-first os.scandir walk in name order, yielding (relative path,
+    depth, entry or OSError). `after` is the path of the last entry a
+    previous page returned, split on '/': the walk resumes right after it,
+    reading only the directories along that path instead of everything
+    before it. Each directory on the current path is held as a sorted list
+    (never the whole tree), and symlinked directories are not followed.
+    """
+    after_name, after_rest = (after[0], after[1:]) if after else (None, ())
+    with os.scandir(root) as it:
+        entries = sorted((e for e in it if after_name is None or e.name > after_name),
+                         key=lambda e: e.name)
+    # The entry we resume after was returned, but maybe not all of its subtree
+    # ('' means only the error line for this directory was)
+    if after_name:
+        path = os.path.join(root, after_name)
+        if depth < max_depth and os.path.isdir(path) and not os.path.islink(path):
+            yield from walk_subdir(path, max_depth, prefix + after_name + '/', after_rest, depth + 1)
+    for entry in entries:
+        rel = prefix + entry.name
+        yield rel, depth, entry
+        if depth < max_depth and entry.is_dir(follow_symlinks=False):
+            yield from walk_subdir(entry.path, max_depth, rel + '/', (), depth + 1)
+
+def walk_subdir(path, max_depth, prefix, after, depth):
+    try:
+        listing = walk(path, max_depth, prefix, after, depth)
+        first = next(listing, None)
+    except OSError as e:
+        if after != ('',):
+            yield prefix, depth, e
+        return
+    if first is not None:
+        yield first
+        yield from listing
+
 @app.route('/files')
 def list_files():
-    """List files in /app directory"""
+    """
+    Stream the tree under FILES_ROOT as NDJSON, one entry per line, then a
+    trailer line with `next_cursor`. Query params: path (relative to the
+    root), depth (0 = just that directory), glob (matched against the name,
+    or the relative path if it contains a '/'), limit, cursor.
+    """
     logger.info("File listing requested")
     try:
-        files = os.listdir('/app')
-        return jsonify({"files": files, "cwd": os.getcwd()})
+        depth = min(int(request.args.get('depth', 0)), FILES_MAX_DEPTH)
+        limit = min(int(request.args.get('limit', 1000)), FILES_MAX_LIMIT)
+        after = decode_cursor(request.args['cursor'])['after'] if 'cursor' in request.args else None
+        if depth < 0 or limit < 1 or not isinstance(after, (str, type(None))):
+            raise ValueError
+    except (ValueError, KeyError, TypeError):
+        return jsonify({"error": "invalid depth, limit or cursor"}), 400
+    pattern = request.args.get('glob')
+
+    root = os.path.realpath(FILES_ROOT)
+    base = os.path.realpath(os.path.join(root, request.args.get('path', '').lstrip('/')))
+    if os.path.commonpath([root, base]) != root:
+        return jsonify({"error": "path escapes the listing root"}), 400
+    prefix = '' if base == root else os.path.relpath(base, root) + '/'
+    resume = tuple(after[len(prefix):].split('/')) if after else ()
+    if (after is not None and not after.startswith(prefix)) or any(part in ('.', '..') for part in resume):
+        return jsonify({"error": "invalid cursor"}), 400
+    try:
+        entries = walk(base, depth, prefix, resume)
+        first = next(entries, None)
+    except (FileNotFoundError, NotADirectoryError) as e:
+        return jsonify({"error": str(e)}), 404
     except Exception as e:
-        logger.error(f"Failed to list files: {e}")
+        logger.error("Failed to list files: %s", e)
         return jsonify({"error": str(e)}), 500
 
+    def generate():
+        emitted = 0
+        last = None
+        try:
+            for rel, level, entry in itertools.chain([first] if first else [], entries):
+                if (pattern and not isinstance(entry, OSError)
+                        and not fnmatch.fnmatchcase(rel if '/' in pattern else entry.name, pattern)):
+                    continue
+                if emitted == limit:
+                    cursor = encode_cursor({"after": last})
+                    yield json.dumps({"next_cursor": cursor, "count": emitted, "cwd": os.getcwd()}) + '\n'
+                    return
+                if isinstance(entry, OSError):
+                    line = {"path": rel, "depth": level, "error": entry.strerror}
+                else:
+                    try:
+                        st = entry.stat(follow_symlinks=False)
+                        line = {"path": rel, "name": entry.name, "type": entry_type(entry), "depth": level,
+                                "size": st.st_size, "mtime": st.st_mtime}
+                    except OSError as e:
+                        line = {"path": rel, "name": entry.name, "depth": level, "error": e.strerror}
+                emitted += 1
+                last = rel
+                yield json.dumps(line) + '\n'
+            yield json.dumps({"next_cursor": None, "count": emitted, "cwd": os.getcwd()}) + '\n'
+        finally:
+            entries.close()
+
+    return Response(generate(), content_type='application/x-ndjson')
+
+def profile_allowed():
+    token = request.headers.get('X-Debug-Token', '')
+    return bool(PROFILE_TOKEN) and hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode())
+
+@app.route('/debug/profile')
+def debug_profile():
+    """Sample every thread for ?seconds=N and return collapsed stacks for a flamegraph"""
+    if not profile_allowed():
+        abort(404)
+    try:
+        seconds = float(request.args.get('seconds', 10))
+    except ValueError:
+        return jsonify({"error": "seconds must be a number"}), 400
+    if not 0 < seconds <= PROFILE_MAX_SECONDS:
+        return jsonify({"error": f"seconds must be between 0 and {PROFILE_MAX_SECONDS:g}"}), 400
+    if not _sampler_lock.acquire(blocking=False):
+        return jsonify({"error": "a profile is already running"}), 409
+    try:
+        logger.warning("Sampling profiler running for %ss", seconds)
+        stacks, samples = profiling.sample(seconds, PROFILE_INTERVAL)
+    finally:
+        _sampler_lock.release()
+    response = Response(stacks, content_type='text/plain; charset=utf-8')
+    response.headers['X-Profile-Samples'] = str(samples)
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus metrics, summed across worker processes"""
+    return Response(get_metrics().render(), content_type=CONTENT_TYPE)
+
 @app.before_request
 def log_request():
-    logger.info(f"Request: {request.method} {request.path} from {request.remote_addr}")
+    g.start = time.perf_counter()
+    g.request_id = request.headers.get('X-Request-ID', '')[:128] or uuid.uuid4().hex
+
+@app.after_request
+def record_request(response):
+    started = g.get('start')
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'other'
+        duration = time.perf_counter() - started
+        get_metrics().observe(route, response.status_code, duration)
+        logger.info('%s %s %s', request.method, request.path, response.status_code, extra={
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 3),
+            'remote_addr': request.remote_addr,
+        })
+    response.headers['X-Request-ID'] = g.get('request_id', '')
+    return response
+
+# Per-request profiling: send `X-Profile: 1` with the debug token and the body
+# is replaced by the request's top functions. Costs one header lookup otherwise.
+# Only the request's own thread is profiled (under gevent: every greenlet).
+@app.before_request
+def start_request_profile():
+    if PROFILE_TOKEN and 'X-Profile' in request.headers and profile_allowed():
+        if _request_profile_lock.acquire(blocking=False):
+            g.profile = profiling.RequestProfile()
+
+@app.after_request
+def finish_request_profile(response):
+    profile = g.pop('profile', None)
+    if profile is None:
+        return response
+    try:
+        report = profile.stop()
+    finally:
+        _request_profile_lock.release()
+    response.close()
+    return Response(report, status=response.status_code, content_type='text/plain; charset=utf-8')
+
+@app.teardown_request
+def abandon_request_profile(exc):
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile.stop()
+        _request_profile_lock.release()
 
 if __name__ == '__main__':
     logger.info("Starting Flask app on 0.0.0.0:5000")
-    logger.info(f"Environment: {os.getenv('FLASK_ENV', 'production')}")
-    logger.info(f"Log level: {os.getenv('LOG_LEVEL', 'INFO')}")
-    
-    app.run(host='0.0.0.0', port=8080, debug=False)
\ No newline at end of file
+    logger.info("Environment: %s", os.getenv('FLASK_ENV', 'production'))
+    logger.info("Log level: %s", os.getenv('LOG_LEVEL', 'INFO'))
+    logger.info("Server mode: %s", SERVER_MODE)
+
+    if SERVER_MODE == 'gevent':
+        from gevent.pool import Pool
+        from gevent.pywsgi import WSGIServer
+        pool = Pool(int(os.getenv('GEVENT_CONNECTIONS', 1000)))
+        WSGIServer(('0.0.0.0', 8080), app, spawn=pool, log=None).serve_forever()
+    else:
+        app.run(host='0.0.0.0', port=8080, debug=False)
\ No newline at end of file
@@ -0,0 +1,201 @@
+# logs.py
+"""
+Structured, non-blocking logging for the debug app.
+
+Request threads only put records on a bounded queue; a background thread
+formats them as JSON lines and writes them to stdout. If stdout is slow (a
+backpressured container log driver) and the queue fills up, new records are
+dropped and counted rather than making the request wait.
+
+Info-and-below records logged while handling a request can be sampled per
+route, e.g. LOG_SAMPLE_RATES="/health=0.01,/=0.1". Warnings and errors are
+always kept.
+
+Under gevent's monkey.patch_all() (SERVER_MODE=gevent) a plain QueueListener
+thread would be a greenlet on the hub's OS thread, where a blocked stdout
+write stalls every request; the writer then runs on a real OS thread instead
+(see OsThreadQueueListener).
+"""
+import atexit
+import datetime
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import traceback
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import g, has_request_context, request
+
+# Attributes every LogRecord has; anything else was passed through `extra=`
+_STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def parse_sample_rates(text):
+    """'/health=0.01,/=0.1' -> {'/health': 0.01, '/': 0.1}"""
+    rates = {}
+    for item in filter(None, (part.strip() for part in (text or '').split(','))):
+        route, _, rate = item.rpartition('=')
+        rates[route.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; `extra=` fields become top-level keys."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc)
+                  .isoformat(timespec='milliseconds').replace('+00:00', 'Z'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+    """
+    Runs on the request thread: tags records with the request id and route,
+    and drops sampled-out info/debug records before they reach the queue.
+    """
+
+    def __init__(self, sample_rates=None, default_rate=1.0):
+        super().__init__()
+        self.sample_rates = sample_rates or {}
+        self.default_rate = default_rate
+
+    def filter(self, record):
+        if not has_request_context():
+            return True
+        route = request.url_rule.rule if request.url_rule else 'other'
+        if record.levelno <= logging.INFO:
+            rate = self.sample_rates.get(route, self.default_rate)
+            if rate < 1.0 and random.random() >= rate:
+                return False
+        record.request_id = g.get('request_id')
+        record.route = route
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that never blocks: a full queue drops the record and counts it."""
+
+    def __init__(self, log_queue, on_drop=None):
+        super().__init__(log_queue)
+        self.on_drop = on_drop
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    def prepare(self, record):
+        # Resolve the message and traceback here, while args and frames are
+        # still valid, but leave the JSON formatting to the writer thread.
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = ''.join(traceback.format_exception(*record.exc_info)).rstrip()
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+            if self.on_drop is not None:
+                self.on_drop()
+
+
+class BoundedSimpleQueue:
+    """
+    The bits of queue.Queue the handler and listener use, on top of the C
+    SimpleQueue. That takes no Python-level locks, which gevent would have
+    patched into greenlet locks that are unsafe to share with a real thread.
+    """
+
+    def __init__(self, maxsize, simple_queue_class):
+        self.maxsize = maxsize
+        self._queue = simple_queue_class()
+
+    def put_nowait(self, item):
+        # Only an approximate bound: enough to stop a stuck writer eating memory
+        if self._queue.qsize() >= self.maxsize:
+            raise queue.Full
+        self._queue.put_nowait(item)
+
+    def get(self, block=True, timeout=None):
+        return self._queue.get(block, timeout)
+
+
+class OsThreadQueueListener(QueueListener):
+    """QueueListener whose writer is a real OS thread even after monkey.patch_all()."""
+
+    def start(self):
+        from gevent import monkey
+        self._done = monkey.get_original('_thread', 'allocate_lock')()
+        self._done.acquire()
+        monkey.get_original('_thread', 'start_new_thread')(self._run, ())
+
+    def _run(self):
+        try:
+            self._monitor()
+        finally:
+            self._done.release()
+
+    def stop(self):
+        self.enqueue_sentinel()
+        # Bounded, so a wedged stdout can't hang shutdown
+        self._done.acquire(timeout=5)
+
+
+def _gevent_patched():
+    monkey = sys.modules.get('gevent.monkey')
+    return monkey is not None and monkey.is_module_patched('threading')
+
+
+_listener = None
+
+
+def configure(level='INFO', sample_rates=None, default_rate=1.0, queue_size=10000, on_drop=None):
+    """Route the root logger through the queue; returns the queue handler."""
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter())
+    handler = DroppingQueueHandler(queue.Queue(queue_size), on_drop)
+    handler.addFilter(RequestContextFilter(sample_rates, default_rate))
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+
+    def start():
+        global _listener
+        if _gevent_patched():
+            from gevent import monkey
+            # The handler lock is only taken by the writer, but make it a real one
+            stream.lock = monkey.get_original('_thread', 'RLock')()
+            handler.queue = BoundedSimpleQueue(queue_size, monkey.get_original('queue', 'SimpleQueue'))
+            _listener = OsThreadQueueListener(handler.queue, stream)
+        else:
+            handler.queue = queue.Queue(queue_size)
+            _listener = QueueListener(handler.queue, stream)
+        _listener.start()
+
+    start()
+    # The writer thread does not survive fork (gunicorn --preload); start a
+    # fresh one, with a fresh queue, in every child.
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=start)
+    atexit.register(lambda: _listener.stop())
+    return handler
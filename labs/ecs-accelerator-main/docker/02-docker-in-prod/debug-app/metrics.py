@@ -0,0 +1,215 @@
+# metrics.py
+"""
+Request counters and latency histograms shared by every worker process.
+
+All numbers live in one mmap'd file (in /dev/shm by default, so it is RAM
+backed and disappears with the container). Each process claims its own slot
+in the file and only ever writes to that slot, under a process-local lock,
+so gunicorn workers never contend with each other. /metrics sums all slots.
+
+A slot left behind by a dead worker is handed to the next process that
+starts, keeping its values, so totals never go backwards when workers are
+recycled.
+"""
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'DBGMETR1'
+HEADER = struct.Struct('8s16sq')   # magic, layout digest, number of slots
+HEADER_SIZE = 64
+
+# Seconds; /slow can legitimately take tens of seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def default_path():
+    shm = '/dev/shm'
+    base = shm if os.path.isdir(shm) and os.access(shm, os.W_OK) else tempfile.gettempdir()
+    return os.path.join(base, 'debug-app-metrics')
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SharedMetrics:
+    """
+    Fixed-layout metrics store. `counters` maps plain counter names to their
+    help text; `routes` get a request count, a 5xx count and a latency
+    histogram each.
+    """
+
+    def __init__(self, routes, counters=None, path=None, slots=64, buckets=LATENCY_BUCKETS):
+        self.routes = list(routes)
+        self.counters = dict(counters or {})
+        self.buckets = tuple(sorted(buckets))
+        self.path = path or default_path()
+        self.slots = slots
+
+        # Per route: requests, errors, one count per bucket plus +Inf, sum
+        self._route_width = len(self.buckets) + 4
+        self._route_index = {route: len(self.counters) + i * self._route_width
+                             for i, route in enumerate(self.routes)}
+        self._counter_index = {name: i for i, name in enumerate(self.counters)}
+        # Slot layout: owner pid, then the values; everything is a float64
+        self._width = 1 + len(self.counters) + len(self.routes) * self._route_width
+
+        layout = repr((list(self.counters), self.routes, self.buckets, slots)).encode()
+        self._digest = hashlib.sha1(layout).digest()[:16]
+
+        self._pid = None
+        self._lock = threading.Lock()
+        self._claim_lock = threading.Lock()
+        self._base = None
+        self._values = None
+        self._open()
+
+    def _open(self):
+        size = HEADER_SIZE + self.slots * self._width * 8
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                header = os.pread(fd, HEADER.size, 0)
+                if (os.fstat(fd).st_size != size or len(header) != HEADER.size
+                        or HEADER.unpack(header) != (MAGIC, self._digest, self.slots)):
+                    # New file, or one written by a different build of the app
+                    os.ftruncate(fd, 0)
+                    os.ftruncate(fd, size)
+                    os.pwrite(fd, HEADER.pack(MAGIC, self._digest, self.slots), 0)
+                self._mm = mmap.mmap(fd, size)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+        self._table = memoryview(self._mm)[HEADER_SIZE:].cast('d')
+
+    def _claim(self):
+        """Take a free (or abandoned) slot for this process."""
+        pid = os.getpid()
+        fd = os.open(self.path, os.O_RDWR)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                for slot in range(self.slots):
+                    base = slot * self._width
+                    owner = int(self._table[base])
+                    if owner == 0 or owner == pid or not _alive(owner):
+                        self._table[base] = pid
+                        return self._table, base
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+        logger.warning('All %d metrics slots are in use; pid %d will only report its own numbers',
+                       self.slots, pid)
+        private = memoryview(bytearray(self._width * 8)).cast('d')
+        private[0] = pid
+        return private, 0
+
+    def _row(self):
+        if self._pid != os.getpid():
+            with self._claim_lock:
+                if self._pid != os.getpid():
+                    # Fresh lock: a forked child may have inherited it held
+                    self._lock = threading.Lock()
+                    self._values, self._base = self._claim()
+                    self._pid = os.getpid()
+        return self._values, self._base
+
+    def inc(self, name, amount=1):
+        values, base = self._row()
+        index = base + 1 + self._counter_index[name]
+        with self._lock:
+            values[index] += amount
+
+    def observe(self, route, status, seconds):
+        values, base = self._row()
+        index = base + 1 + self._route_index.get(route, self._route_index.get('other'))
+        bucket = sum(1 for bound in self.buckets if bound < seconds)
+        with self._lock:
+            values[index] += 1
+            if status >= 500:
+                values[index + 1] += 1
+            values[index + 2 + bucket] += 1
+            values[index + self._route_width - 1] += seconds
+
+    def snapshot(self):
+        """Sum of every slot that has ever been claimed, plus the live process count."""
+        self._row()
+        totals = [0.0] * (self._width - 1)
+        processes = 0
+        for slot in range(self.slots):
+            base = slot * self._width
+            owner = int(self._table[base])
+            if owner == 0:
+                continue
+            if _alive(owner):
+                processes += 1
+            row = self._table[base + 1:base + self._width]
+            totals = [a + b for a, b in zip(totals, row)]
+        if self._values is not self._table:
+            totals = [a + b for a, b in zip(totals, self._values[1:])]
+            processes += 1
+        return totals, processes
+
+    def value(self, name):
+        """One counter summed across processes, without copying whole slots."""
+        values, _ = self._row()
+        offset = 1 + self._counter_index[name]
+        total = sum(self._table[slot * self._width + offset] for slot in range(self.slots))
+        if values is not self._table:
+            total += values[offset]
+        return int(total)
+
+    def render(self, prefix='debug_app'):
+        totals, processes = self.snapshot()
+        lines = [
+            f'# HELP {prefix}_processes Worker processes currently reporting metrics',
+            f'# TYPE {prefix}_processes gauge',
+            f'{prefix}_processes {processes}',
+        ]
+        for name, documentation in self.counters.items():
+            lines += [
+                f'# HELP {prefix}_{name}_total {documentation}',
+                f'# TYPE {prefix}_{name}_total counter',
+                f'{prefix}_{name}_total {int(totals[self._counter_index[name]])}',
+            ]
+
+        requests = [f'# HELP {prefix}_http_requests_total HTTP requests by route',
+                    f'# TYPE {prefix}_http_requests_total counter']
+        errors = [f'# HELP {prefix}_http_errors_total HTTP 5xx responses by route',
+                  f'# TYPE {prefix}_http_errors_total counter']
+        latency = [f'# HELP {prefix}_http_request_duration_seconds Request latency by route',
+                   f'# TYPE {prefix}_http_request_duration_seconds histogram']
+        for route in self.routes:
+            index = self._route_index[route]
+            label = f'route="{route}"'
+            requests.append(f'{prefix}_http_requests_total{{{label}}} {int(totals[index])}')
+            errors.append(f'{prefix}_http_errors_total{{{label}}} {int(totals[index + 1])}')
+            cumulative = 0
+            for i, bound in enumerate(self.buckets + (float('inf'),)):
+                cumulative += int(totals[index + 2 + i])
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                latency.append(f'{prefix}_http_request_duration_seconds_bucket{{{label},le="{le}"}} {cumulative}')
+            latency.append(f'{prefix}_http_request_duration_seconds_sum{{{label}}} '
+                           f'{totals[index + self._route_width - 1]:.6f}')
+            latency.append(f'{prefix}_http_request_duration_seconds_count{{{label}}} {int(totals[index])}')
+        return '\n'.join(lines + requests + errors + latency) + '\n'
@@ -0,0 +1,99 @@
+# profiling.py
+"""
+On-demand profiling for a running container.
+
+sample() is a wall-clock sampling profiler: it walks sys._current_frames()
+every `interval` seconds and counts whole stacks, which it returns in the
+collapsed format flamegraph.pl and speedscope read ("a;b;c 42"). Nothing is
+installed between runs, so it costs nothing when idle. Under SERVER_MODE=gevent
+only OS threads are visible, not individual greenlets.
+
+RequestProfile profiles one request deterministically and renders its top
+functions. It hooks sys.setprofile, which only sees the calling thread;
+cProfile can't be used here because on Python 3.12+ it is built on
+sys.monitoring and records every thread in the process. Being pure Python it
+inflates absolute timings a few times over, so compare functions, not totals.
+Under SERVER_MODE=gevent all greenlets share the hub's thread, so requests
+running concurrently with the profiled one show up in its report.
+"""
+import collections
+import io
+import os
+import profile
+import pstats
+import sys
+import threading
+import time
+
+
+def _label(code, cache):
+    label = cache.get(code)
+    if label is None:
+        label = f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+        cache[code] = label
+    return label
+
+
+def sample(seconds, interval=0.005):
+    """Sample every other thread for `seconds`; returns (collapsed stacks, samples)."""
+    me = threading.get_ident()
+    names = {}
+    labels = {}
+    counts = collections.Counter()
+    samples = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            if ident not in names:
+                names = {t.ident: t.name for t in threading.enumerate()}
+            stack = []
+            while frame is not None:
+                stack.append(_label(frame.f_code, labels))
+                frame = frame.f_back
+            stack.append(names.get(ident, f'thread-{ident}'))
+            counts[';'.join(reversed(stack))] += 1
+        samples += 1
+        time.sleep(interval)
+    lines = [f'{stack} {count}' for stack, count in counts.most_common()]
+    return '\n'.join(lines) + '\n', samples
+
+
+class _ThreadProfile(profile.Profile):
+    """
+    profile.Profile started part-way down a stack. It asserts on returns from
+    frames it never saw called (the hook that started it, the server code
+    around the view, other greenlets); those are ignored instead.
+    """
+
+    def _trace_return(self, frame, t):
+        cur = self.cur
+        if frame is cur[-2] or (cur[-1] is not None and frame is cur[-2].f_back):
+            return profile.Profile.trace_dispatch_return(self, frame, t)
+        return 0
+
+    dispatch = dict(profile.Profile.dispatch, **{
+        'return': _trace_return,
+        'c_return': _trace_return,
+        'c_exception': _trace_return,
+    })
+
+
+class RequestProfile:
+    """Deterministic profile of a single request, on the calling thread only."""
+
+    def __init__(self):
+        self._profiler = _ThreadProfile()
+        self._started = time.perf_counter()
+        sys.setprofile(self._profiler.dispatcher)
+
+    def stop(self, top=25, sort='cumulative'):
+        sys.setprofile(None)
+        elapsed = time.perf_counter() - self._started
+        # Close the frames still open when profiling stopped (the hook calling us)
+        self._profiler.simulate_cmd_complete()
+        out = io.StringIO()
+        stats = pstats.Stats(self._profiler, stream=out)
+        stats.strip_dirs().sort_stats(sort).print_stats(top)
+        return f'request took {elapsed * 1000:.1f}ms\n' + out.getvalue()
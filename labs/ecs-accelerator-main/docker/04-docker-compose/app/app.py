@@ -1,7 +1,11 @@
 import os
+import random
+import socket
+import sys
+import threading
 import time
-import psycopg2
-from flask import Flask
+from psycopg2 import pool
+from flask import Flask, jsonify
 
 app = Flask(__name__)
 
@@ -10,16 +14,138 @@ DB_PORT = os.getenv("DB_PORT")
 DB_NAME = os.getenv("DB_NAME")
 DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", 5))
+# ThreadedConnectionPool only keeps DB_POOL_MIN returned connections and closes
+# the rest, so anything below DB_POOL_MAX means reconnecting under concurrency
+DB_POOL_MIN = min(int(os.getenv("DB_POOL_MIN", DB_POOL_MAX)), DB_POOL_MAX)
+# Seconds a /db request waits for a free pooled connection before a 503
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 5))
+# Short, so a dead host costs one quick attempt rather than the libpq default
+# wait. libpq treats anything below 2 as 2.
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", 2))
 
+# Readiness: retry each dependency with capped exponential backoff plus full
+# jitter until READY_DEADLINE seconds have passed. The backoff cap bounds how
+# long after a dependency comes up we notice it.
+READY_DEADLINE = float(os.getenv("READY_DEADLINE", 60))
+READY_BACKOFF_BASE = float(os.getenv("READY_BACKOFF_BASE", 0.05))
+READY_BACKOFF_MAX = float(os.getenv("READY_BACKOFF_MAX", 0.5))
+# Exit when the deadline passes so the orchestrator restarts us, instead of
+# serving a container that can never work
+READY_EXIT_ON_FAILURE = os.getenv("READY_EXIT_ON_FAILURE", "1") == "1"
+# Extra TCP dependencies to wait for, e.g. "redis:6379,search:9200"
+READY_TCP = os.getenv("READY_TCP", "")
 
-def get_db_connection():
-    return psycopg2.connect(
-        host=DB_HOST,
-        port=DB_PORT,
-        dbname=DB_NAME,
-        user=DB_USER,
-        password=DB_PASSWORD,
-    )
+db_pool = None
+# ThreadedConnectionPool raises instead of waiting once DB_POOL_MAX connections
+# are out, so requests queue here for a slot before calling getconn()
+db_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+
+
+def check_db():
+    """Open the pool; its DB_POOL_MIN connections stay warm for /db."""
+    global db_pool
+    if db_pool is None:
+        db_pool = pool.ThreadedConnectionPool(
+            DB_POOL_MIN,
+            DB_POOL_MAX,
+            host=DB_HOST,
+            port=DB_PORT,
+            dbname=DB_NAME,
+            user=DB_USER,
+            password=DB_PASSWORD,
+            connect_timeout=DB_CONNECT_TIMEOUT,
+        )
+
+
+def tcp_check(host, port):
+    def check():
+        socket.create_connection((host, int(port)), timeout=DB_CONNECT_TIMEOUT).close()
+    return check
+
+
+class Readiness:
+    """
+    Runs every dependency check in its own thread, in parallel, and tracks
+    each one as "starting", "ready" or "failed" (deadline passed).
+    """
+
+    def __init__(self, checks):
+        self.checks = checks
+        self.started = time.monotonic()
+        self.deps = {name: {"status": "starting", "attempts": 0, "error": None, "ready_after": None}
+                     for name in checks}
+        self._lock = threading.Lock()
+        self._started = False
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            self.started = time.monotonic()
+        for name, check in self.checks.items():
+            threading.Thread(target=self._wait_for, args=(name, check), name=f"ready-{name}", daemon=True).start()
+
+    def _wait_for(self, name, check):
+        deadline = self.started + READY_DEADLINE
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                check()
+            except Exception as e:
+                with self._lock:
+                    self.deps[name].update(attempts=attempt, error=str(e).strip())
+                delay = random.uniform(0, min(READY_BACKOFF_MAX, READY_BACKOFF_BASE * 2 ** attempt))
+                if time.monotonic() + delay > deadline:
+                    break
+                print(f"{name} not ready yet (attempt {attempt}): {str(e).strip()}", flush=True)
+                time.sleep(delay)
+                continue
+            elapsed = time.monotonic() - self.started
+            with self._lock:
+                self.deps[name].update(status="ready", attempts=attempt, error=None,
+                                       ready_after=round(elapsed, 3))
+            print(f"{name} ready after {elapsed:.2f}s ({attempt} attempts)", flush=True)
+            return
+
+        with self._lock:
+            self.deps[name]["status"] = "failed"
+        print(f"{name} still unavailable after {READY_DEADLINE:g}s, giving up", file=sys.stderr, flush=True)
+        if READY_EXIT_ON_FAILURE:
+            os._exit(1)
+
+    def snapshot(self):
+        with self._lock:
+            deps = {name: dict(state) for name, state in self.deps.items()}
+        statuses = {state["status"] for state in deps.values()}
+        if "failed" in statuses:
+            status = "failed"
+        elif statuses <= {"ready"}:
+            status = "ready"
+        else:
+            status = "starting"
+        return {"status": status, "dependencies": deps}
+
+    def is_ready(self, name=None):
+        with self._lock:
+            if name is not None:
+                return self.deps[name]["status"] == "ready"
+            return all(state["status"] == "ready" for state in self.deps.values())
+
+
+checks = {"db": check_db}
+for target in filter(None, (item.strip() for item in READY_TCP.split(","))):
+    host, _, port = target.rpartition(":")
+    checks[target] = tcp_check(host, port)
+readiness = Readiness(checks)
+
+
+@app.before_request
+def start_readiness():
+    # No-op once started; covers servers that import the app instead of running __main__
+    readiness.start()
 
 
 @app.route("/")
@@ -27,33 +153,55 @@ def index():
     return "Docker Compose is working 🚀"
 
 
+@app.route("/livez")
+def livez():
+    return jsonify({"status": "alive"})
+
+
+@app.route("/readyz")
+def readyz():
+    snapshot = readiness.snapshot()
+    return jsonify(snapshot), 200 if snapshot["status"] == "ready" else 503
+
+
 @app.route("/db")
 def db_check():
+    if not readiness.is_ready("db"):
+        return "Database not ready yet (starting)", 503
+    if not db_slots.acquire(timeout=DB_POOL_TIMEOUT):
+        return "Database busy, try again", 503, {"Retry-After": "1"}
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT NOW();")
-        result = cur.fetchone()
-        cur.close()
-        conn.close()
-        return f"Database connected. Time: {result[0]}"
-    except Exception as e:
-        return f"Database connection failed: {e}", 500
+        return query_now()
+    finally:
+        db_slots.release()
+
+
+def query_now():
+    # Two tries: a pooled connection may have died with a DB restart
+    for attempt in range(2):
+        conn = None
+        try:
+            conn = db_pool.getconn()
+            cur = conn.cursor()
+            cur.execute("SELECT NOW();")
+            result = cur.fetchone()
+            cur.close()
+            conn.rollback()
+            db_pool.putconn(conn)
+            return f"Database connected. Time: {result[0]}"
+        except Exception as e:
+            if conn is not None:
+                # Drop the connection instead of handing a broken one to the next request
+                db_pool.putconn(conn, close=True)
+            if attempt == 1 or conn is None:
+                return f"Database connection failed: {e}", 500
 
 
 if __name__ == "__main__":
     print("Starting app...")
     print(f"Connecting to DB at {DB_HOST}:{DB_PORT}")
 
-    # naive retry loop – great teaching moment
-    for i in range(5):
-        try:
-            conn = get_db_connection()
-            conn.close()
-            print("Database connection successful")
-            break
-        except Exception as e:
-            print(f"DB not ready yet ({i+1}/5): {e}")
-            time.sleep(3)
+    # Checks run in the background; /readyz reports "starting" until they pass
+    readiness.start()
 
     app.run(host="0.0.0.0", port=8000)
@@ -0,0 +1,92 @@
+"""
+Metric families of the web app, shared by the Flask (main.py) and ASGI
+(asgi.py) serving modes.
+
+They live here rather than in main.py because `python main.py async` runs
+main.py as __main__ and asgi.py then imports it a second time as `main`;
+definitions in main.py would register every family twice. This module is only
+ever imported once per process.
+
+The callbacks read live state through the *_provider hooks below: main.py
+points them at its own functions when imported, and asgi.py replaces
+pool_stats_provider with the stats of its async pools.
+"""
+
+import metrics
+
+BACKEND_SECONDS = metrics.Histogram(
+    "backend_call_duration_seconds",
+    "Latency of Postgres and Redis calls.",
+    ["backend", "operation"],
+)
+BACKEND_ERRORS = metrics.Counter(
+    "backend_call_errors_total",
+    "Postgres and Redis calls that raised.",
+    ["backend", "operation"],
+)
+HTTP_SECONDS = metrics.Histogram(
+    "http_request_duration_seconds",
+    "Latency of HTTP requests by route.",
+    ["method", "route", "status"],
+)
+
+# Each returns the same dict as the matching /api/pool, /api/health checks and
+# /api/cache payloads. A callback whose provider is unset renders no samples.
+pool_stats_provider = None
+health_provider = None
+cache_stats_provider = None
+
+
+def pool_metric_values():
+    stats = pool_stats_provider()
+    return {
+        ("postgres", "in_use"): stats["postgres"]["in_use"],
+        ("postgres", "idle"): stats["postgres"]["idle"],
+        ("postgres", "max"): stats["postgres"]["max"],
+        ("redis", "in_use"): stats["redis"]["in_use"],
+        ("redis", "idle"): stats["redis"]["idle"],
+        ("redis", "max"): stats["redis"]["max"],
+    }
+
+
+metrics.Callback(
+    "pool_connections",
+    "Connections per pool and state in this process.",
+    pool_metric_values,
+    ["backend", "state"],
+)
+metrics.Callback(
+    "dependency_up",
+    "1 if the latest background health check of the dependency passed.",
+    lambda: {(name,): int(check["ok"]) for name, check in health_provider().items()},
+    ["dependency"],
+)
+metrics.Callback(
+    "dependency_check_latency_ms",
+    "Latency of the latest background health check.",
+    lambda: {
+        (name,): check["latency_ms"]
+        for name, check in health_provider().items()
+        if check["latency_ms"] is not None
+    },
+    ["dependency"],
+)
+metrics.Callback(
+    "pg_pool_wait_seconds_total",
+    "Time spent waiting for a pooled Postgres connection.",
+    lambda: {(): pool_stats_provider()["postgres"]["wait_seconds_total"]},
+    kind="counter",
+)
+metrics.Callback(
+    "pg_pool_timeouts_total",
+    "Postgres pool checkouts that timed out.",
+    lambda: {(): pool_stats_provider()["postgres"]["timeouts"]},
+    kind="counter",
+)
+metrics.Callback(
+    "feed_cache_events_total",
+    "Feed cache hits, misses, coalesced misses, lock waits and errors.",
+    lambda: {(event,): value for event, value in cache_stats_provider().items()},
+    ["event"],
+    kind="counter",
+)
@@ -0,0 +1,491 @@
+"""
+Async (ASGI) serving mode for the lab app: `python main.py async`.
+
+Same routes and JSON contracts as the Flask app in main.py, but built on
+asyncpg and redis.asyncio so independent backend calls (the Postgres page and
+the Redis state in GET /api/messages) run concurrently and one process can
+hold thousands of in-flight requests. Health endpoints read the background
+prober's cache from main.py. Config, migrations,
+cursor helpers and the feed cache keys are shared with main.py, so both modes
+can run side by side against the same Postgres and Redis.
+"""
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+import asyncpg
+import redis.asyncio as aioredis
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.responses import HTMLResponse, Response
+from starlette.routing import Route
+from werkzeug.http import generate_etag, parse_etags
+
+import app_metrics
+import main
+import metrics
+from app_metrics import BACKEND_ERRORS, BACKEND_SECONDS, HTTP_SECONDS
+
+logger = logging.getLogger("app")
+
+pg_pool = None
+redis_pool = None
+pool_waits = {"waits": 0, "wait_seconds_total": 0.0, "wait_seconds_max": 0.0, "timeouts": 0}
+_feed_flights = {}
+
+
+def json_response(payload, status: int = 200) -> Response:
+    # Serialize exactly like Flask's jsonify so feed cache entries are
+    # byte-identical whichever mode wrote them.
+    return Response(main.app.json.dumps(payload), status, media_type="application/json")
+
+
+def get_redis_client() -> aioredis.Redis:
+    return aioredis.Redis(connection_pool=redis_pool)
+
+
+@asynccontextmanager
+async def pg_connection():
+    """Borrow a connection from the asyncpg pool, recording checkout waits."""
+    started = time.monotonic()
+    try:
+        conn = await pg_pool.acquire(timeout=main.PG_POOL_TIMEOUT)
+    except asyncio.TimeoutError:
+        pool_waits["timeouts"] += 1
+        raise main.PoolTimeout(
+            f"no Postgres connection available after {main.PG_POOL_TIMEOUT}s "
+            f"(max={main.PG_POOL_MAX})"
+        )
+    elapsed = time.monotonic() - started
+    # An uncontended acquire returns in microseconds; only count real waits.
+    if elapsed > 0.001:
+        pool_waits["waits"] += 1
+        pool_waits["wait_seconds_total"] += elapsed
+        pool_waits["wait_seconds_max"] = max(pool_waits["wait_seconds_max"], elapsed)
+    try:
+        yield conn
+    finally:
+        await pg_pool.release(conn)
+
+
+async def ensure_schema():
+    async with pg_connection() as conn:
+        exists = await conn.fetchval("SELECT to_regclass('schema_version') IS NOT NULL")
+        version = (
+            await conn.fetchval("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+            if exists
+            else 0
+        )
+    if version < main.SCHEMA_VERSION:
+        logger.info(
+            "Schema at version %s, expected %s; migrating", version, main.SCHEMA_VERSION
+        )
+        version = await asyncio.to_thread(main.run_migrations)
+    main.applied_schema_version = version
+    return version
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global pg_pool, redis_pool
+    # Created per process, so every uvicorn worker owns its own pools.
+    pg_pool = await asyncpg.create_pool(
+        host=main.PG_HOST,
+        port=5432,
+        database="postgres",
+        user="postgres",
+        password="postgres",
+        min_size=main.PG_POOL_MIN,
+        max_size=main.PG_POOL_MAX,
+        max_inactive_connection_lifetime=main.PG_POOL_VALIDATE_AFTER,
+        timeout=main.PG_CONNECT_TIMEOUT,
+    )
+    redis_pool = aioredis.BlockingConnectionPool(
+        host=main.REDIS_HOST,
+        port=6379,
+        db=0,
+        decode_responses=True,
+        max_connections=main.REDIS_POOL_MAX,
+        timeout=main.REDIS_POOL_TIMEOUT,
+        health_check_interval=main.REDIS_HEALTH_CHECK_INTERVAL,
+    )
+    # The probe threads are shared with the Flask mode (see main.DependencyProbe).
+    main.ensure_prober()
+    try:
+        await ensure_schema()
+    except Exception as exc:
+        logger.warning("Schema check at startup failed: %s", exc)
+    try:
+        yield
+    finally:
+        await pg_pool.close()
+        await redis_pool.disconnect()
+
+
+@metrics.timed(BACKEND_SECONDS, BACKEND_ERRORS, "postgres", "write_to_db")
+async def write_to_db(user_input: str) -> str:
+    async with pg_connection() as conn:
+        await conn.execute("INSERT INTO inputs (value) VALUES ($1)", user_input)
+    logger.info("Inserted message into Postgres", extra={"value": user_input})
+    return "Input written to Postgres"
+
+
+@metrics.timed(BACKEND_SECONDS, BACKEND_ERRORS, "postgres", "write_many_to_db")
+async def write_many_to_db(user_inputs: list) -> list:
+    async with pg_connection() as conn:
+        rows = await conn.fetch(
+            """
+            INSERT INTO inputs (value)
+            SELECT value FROM unnest($1::text[]) WITH ORDINALITY AS batch(value, n)
+            ORDER BY n
+            RETURNING id
+            """,
+            user_inputs,
+        )
+    ids = sorted(row["id"] for row in rows)
+    logger.info("Inserted message batch into Postgres", extra={"count": len(ids)})
+    return ids
+
+
+@metrics.timed(BACKEND_SECONDS, BACKEND_ERRORS, "postgres", "read_from_db")
+async def read_from_db(limit: int = 10, before_id=None, after=None, before=None):
+    conditions = []
+    params = []
+    for column, op, value in (
+        ("id", "<", before_id),
+        ("created_at", ">=", after),
+        ("created_at", "<", before),
+    ):
+        if value is not None:
+            params.append(value)
+            conditions.append(f"{column} {op} ${len(params)}")
+    where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+    params.append(limit)
+
+    async with pg_connection() as conn:
+        return await conn.fetch(
+            f"SELECT id, value, created_at FROM inputs {where}"
+            f"ORDER BY id DESC LIMIT ${len(params)}",
+            *params,
+        )
+
+
+@metrics.timed(BACKEND_SECONDS, BACKEND_ERRORS, "redis", "write_to_redis")
+async def write_to_redis(user_input: str) -> str:
+    r = get_redis_client()
+    async with r.pipeline(transaction=False) as pipe:
+        pipe.set("last_input", user_input)
+        pipe.incr("input_count")
+        pipe.lpush("jobs", user_input)
+        pipe.delete(*main.FEED_CACHE_KEYS)
+        await pipe.execute()
+    logger.info("Pushed job to Redis list", extra={"value": user_input})
+    return "Input written to Redis"
+
+
+@metrics.timed(BACKEND_SECONDS, BACKEND_ERRORS, "redis", "write_many_to_redis")
+async def write_many_to_redis(user_inputs: list) -> str:
+    r = get_redis_client()
+    async with r.pipeline(transaction=True) as pipe:
+        pipe.set("last_input", user_inputs[-1])
+        pipe.incrby("input_count", len(user_inputs))
+        pipe.lpush("jobs", *user_inputs)
+        pipe.delete(*main.FEED_CACHE_KEYS)
+        await pipe.execute()
+    logger.info("Pushed job batch to Redis list", extra={"count": len(user_inputs)})
+    return "Batch written to Redis"
+
+
+@metrics.timed(BACKEND_SECONDS, BACKEND_ERRORS, "redis", "read_from_redis")
+async def read_from_redis():
+    last, count = await get_redis_client().mget("last_input", "input_count")
+    return {"last_input": last, "input_count": int(count) if count else 0}
+
+
+async def build_messages_page(limit, before_id, after, before, state) -> str:
+    rows, redis_state = await asyncio.gather(
+        read_from_db(limit=limit, before_id=before_id, after=after, before=before),
+        read_from_redis(),
+    )
+    items = [
+        {
+            "id": row["id"],
+            "value": row["value"],
+            "created_at": row["created_at"].isoformat()
+            if isinstance(row["created_at"], datetime)
+            else str(row["created_at"]),
+        }
+        for row in rows
+    ]
+
+    next_cursor = None
+    if len(rows) == limit:
+        next_cursor = main.encode_cursor(
+            {
+                "before_id": rows[-1]["id"],
+                "after": state.get("after"),
+                "before": state.get("before"),
+            }
+        )
+
+    return main.app.json.dumps(
+        {"messages": items, "redis": redis_state, "next_cursor": next_cursor}
+    )
+
+
+async def _fill_feed(r, key: str, build):
+    lock_key = f"{key}:lock"
+    token = uuid.uuid4().hex
+    if not await r.set(lock_key, token, nx=True, px=main.FEED_CACHE_LOCK_MS):
+        deadline = time.monotonic() + main.FEED_CACHE_LOCK_MS / 1000
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+            body = await r.get(key)
+            if body is not None:
+                main._count("lock_waits")
+                return body
+
+    try:
+        body = await build()
+        await r.set(key, body, ex=main.FEED_CACHE_TTL)
+    finally:
+        await r.eval(main._RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+    return body
+
+
+async def read_feed_cached(limit: int, build) -> str:
+    """Async twin of main.read_feed_cached; coalesces misses onto one task."""
+    key = f"feed:{limit}"
+    r = get_redis_client()
+    try:
+        body = await r.get(key)
+    except aioredis.RedisError:
+        main._count("errors")
+        return await build()
+    if body is not None:
+        main._count("hits")
+        return body
+
+    main._count("misses")
+    flight = _feed_flights.get(key)
+    if flight is not None:
+        main._count("coalesced")
+    else:
+        flight = _feed_flights[key] = asyncio.ensure_future(_fill_feed(r, key, build))
+        flight.add_done_callback(lambda _: _feed_flights.pop(key, None))
+    try:
+        # shield: a cancelled waiter must not cancel the fill for everyone else.
+        return await asyncio.shield(flight)
+    except aioredis.RedisError:
+        main._count("errors")
+        return await build()
+
+
+async def index(request):
+    return HTMLResponse(main.index())
+
+
+async def create_message(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        data = {}
+    text = data.get("text") or os.getenv("APP_INPUT", "hello from docker compose")
+
+    pg_msg = await write_to_db(text)
+    redis_msg = await write_to_redis(text)
+
+    return json_response({"text": text, "postgres": pg_msg, "redis": redis_msg})
+
+
+async def create_messages_batch(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    messages = data.get("messages") if isinstance(data, dict) else None
+    if not isinstance(messages, list) or not messages:
+        return json_response({"error": "expected a non-empty 'messages' list"}, 400)
+    if len(messages) > main.MAX_BATCH_SIZE:
+        return json_response(
+            {"error": f"batch too large (max {main.MAX_BATCH_SIZE} messages)"}, 413
+        )
+
+    texts = []
+    for index_, message in enumerate(messages):
+        text = message.get("text") if isinstance(message, dict) else message
+        if not isinstance(text, str) or not text:
+            return json_response({"error": f"message {index_} has no text"}, 400)
+        texts.append(text)
+
+    ids = await write_many_to_db(texts)
+    redis_msg = await write_many_to_redis(texts)
+
+    return json_response(
+        {
+            "count": len(texts),
+            "items": [{"id": id_, "text": text} for id_, text in zip(ids, texts)],
+            "postgres": f"{len(ids)} inputs written to Postgres",
+            "redis": redis_msg,
+        }
+    )
+
+
+async def list_messages(request):
+    args = request.query_params
+    try:
+        limit = max(1, min(int(args.get("limit", "10")), 100))
+    except ValueError:
+        limit = 10
+
+    try:
+        if "cursor" in args:
+            state = main.decode_cursor(args["cursor"])
+        else:
+            state = {
+                "before_id": args.get("before_id"),
+                "after": args.get("after"),
+                "before": args.get("before"),
+            }
+        before_id = int(state["before_id"]) if state.get("before_id") is not None else None
+        after = main.parse_timestamp(state.get("after"))
+        before = main.parse_timestamp(state.get("before"))
+    except (ValueError, TypeError, OverflowError):
+        return json_response({"error": "invalid cursor, before_id, after or before"}, 400)
+
+    def build():
+        return build_messages_page(limit, before_id, after, before, state)
+
+    if before_id is None and after is None and before is None:
+        body = await read_feed_cached(limit, build)
+    else:
+        body = await build()
+
+    etag = generate_etag(body.encode())
+    headers = {"ETag": f'"{etag}"', "Cache-Control": "no-cache"}
+    if parse_etags(request.headers.get("if-none-match")).contains(etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+async def health(request):
+    checks = main.health_snapshot()
+    failing = [f"{name}: {check['error']}" for name, check in checks.items() if not check["ok"]]
+    status = f"error: {'; '.join(failing)}" if failing else "ok"
+    return json_response({"status": status, "schema_version": main.applied_schema_version})
+
+
+async def livez(request):
+    return json_response(
+        {"status": "ok", "pid": os.getpid(), "uptime": round(time.time() - main._started_at, 3)}
+    )
+
+
+async def readyz(request):
+    checks = main.health_snapshot()
+    ready = all(check["ok"] for check in checks.values())
+    return json_response(
+        {"status": "ready" if ready else "not ready", "checks": checks},
+        200 if ready else 503,
+    )
+
+
+def pool_stats():
+    idle = len(getattr(redis_pool, "_available_connections", []))
+    in_use = len(getattr(redis_pool, "_in_use_connections", []))
+    return {
+        "pid": os.getpid(),
+        "postgres": {
+            "in_use": pg_pool.get_size() - pg_pool.get_idle_size(),
+            "idle": pg_pool.get_idle_size(),
+            "min": pg_pool.get_min_size(),
+            "max": pg_pool.get_max_size(),
+            "waits": pool_waits["waits"],
+            "wait_seconds_total": round(pool_waits["wait_seconds_total"], 6),
+            "wait_seconds_max": round(pool_waits["wait_seconds_max"], 6),
+            "timeouts": pool_waits["timeouts"],
+        },
+        "redis": {
+            "in_use": in_use,
+            "idle": idle,
+            "max": redis_pool.max_connections,
+        },
+    }
+
+
+async def pool(request):
+    return json_response(pool_stats())
+
+
+async def metrics_endpoint(request):
+    return Response(metrics.render(), headers={"Content-Type": metrics.CONTENT_TYPE})
+
+
+class RequestMetrics:
+    """ASGI middleware recording HTTP_SECONDS, labelled like the Flask app."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            HTTP_SECONDS.labels(
+                scope["method"], route.path if route is not None else "unmatched", status
+            ).observe(time.perf_counter() - started)
+
+
+async def pool_exhausted(request, exc):
+    logger.warning("%s", exc)
+    return Response(
+        main.app.json.dumps({"error": str(exc)}),
+        503,
+        headers={"Retry-After": "1"},
+        media_type="application/json",
+    )
+
+
+async def cache(request):
+    return json_response(main.cache_stats_snapshot())
+
+
+app = Starlette(
+    routes=[
+        Route("/", index),
+        Route("/api/messages", create_message, methods=["POST"]),
+        Route("/api/messages/batch", create_messages_batch, methods=["POST"]),
+        Route("/api/messages", list_messages, methods=["GET"]),
+        Route("/api/health", health, methods=["GET"]),
+        Route("/livez", livez, methods=["GET"]),
+        Route("/readyz", readyz, methods=["GET"]),
+        Route("/api/pool", pool, methods=["GET"]),
+        Route("/api/cache", cache, methods=["GET"]),
+        Route("/metrics", metrics_endpoint, methods=["GET"]),
+    ],
+    middleware=[Middleware(RequestMetrics)],
+    exception_handlers={main.PoolTimeout: pool_exhausted},
+    lifespan=lifespan,
+)
+app_metrics.pool_stats_provider = pool_stats
@@ -0,0 +1,501 @@
+"""
+Load-test and benchmark harness for the compose lab (main.py API + worker.py).
+
+Scenarios:
+  post          every request is POST /api/messages
+  get           every request is GET /api/messages?limit=10
+  mixed         90% GET, 10% POST
+  worker-drain  preload --jobs jobs, then drain them with worker.py's batch loop
+  all           run all of the above in order
+
+Backends:
+  fake   (default) everything in this process: the Flask app is served on
+         127.0.0.1 with in-memory stand-ins for Postgres and Redis that add
+         --pg-latency-ms / --redis-latency-ms per round trip. No network,
+         no containers, measures the app's own overhead.
+  local  real Postgres and Redis, e.g. local stand-in processes or the compose
+         db/redis ports. Set PG_HOST / REDIS_HOST; the app is started in
+         this process unless --url points at one that is already running.
+
+Results (RPS, p50/p95/p99 latency, jobs/sec) are written as JSON so runs can
+be compared across commits:
+
+  python bench.py all --duration 10 --concurrency 16 --output results.json
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+from werkzeug.serving import make_server
+
+import main
+import worker
+
+SCENARIOS = ("post", "get", "mixed", "worker-drain")
+GET_PATH = "/api/messages?limit=10"
+
+
+# In-process stand-ins ---------------------------------------------------------
+
+
+class FakeRedis:
+    """
+    The subset of redis-py that main.py and worker.py use, held in memory.
+    Every command (or pipeline) costs one simulated round trip of `latency`.
+    """
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self._data = {}
+        self._cond = threading.Condition()
+
+    def _round_trip(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _list(self, key):
+        return self._data.setdefault(key, deque())
+
+    def _call(self, name, *args, **kwargs):
+        return getattr(self, f"_{name}")(*args, **kwargs)
+
+    # Commands, applied with self._cond held ---------------------------------
+
+    def _get(self, key):
+        return self._data.get(key)
+
+    def _set(self, key, value, ex=None, px=None, nx=False):
+        if nx and key in self._data:
+            return None
+        self._data[key] = str(value)
+        return True
+
+    def _incrby(self, key, amount=1):
+        value = int(self._data.get(key, 0)) + amount
+        self._data[key] = str(value)
+        return value
+
+    def _incr(self, key):
+        return self._incrby(key, 1)
+
+    def _mget(self, *keys):
+        return [self._data.get(key) for key in keys]
+
+    def _lpush(self, key, *values):
+        items = self._list(key)
+        items.extendleft(values)
+        self._cond.notify_all()
+        return len(items)
+
+    def _rpush(self, key, *values):
+        items = self._list(key)
+        items.extend(values)
+        self._cond.notify_all()
+        return len(items)
+
+    def _lmove(self, source, destination, src="RIGHT", dest="LEFT"):
+        items = self._data.get(source)
+        if not items:
+            return None
+        value = items.pop() if src == "RIGHT" else items.popleft()
+        target = self._list(destination)
+        target.append(value) if dest == "RIGHT" else target.appendleft(value)
+        return value
+
+    def _delete(self, *keys):
+        return sum(1 for key in keys if self._data.pop(key, None) is not None)
+
+    def _exists(self, *keys):
+        return sum(1 for key in keys if key in self._data)
+
+    def _ping(self):
+        return True
+
+    def _eval(self, script, numkeys, *args):
+        keys, argv = args[:numkeys], args[numkeys:]
+        if script == main._RELEASE_LOCK_SCRIPT:
+            if self._data.get(keys[0]) == argv[0]:
+                return self._delete(keys[0])
+            return 0
+        if script == worker.REQUEUE_SCRIPT:
+            moved = 0
+            while self._lmove(keys[0], keys[1], "LEFT", "RIGHT") is not None:
+                moved += 1
+            return moved
+        raise NotImplementedError("FakeRedis only knows the lab's own scripts")
+
+    # Public API -------------------------------------------------------------
+
+    def __getattr__(self, name):
+        if not hasattr(type(self), f"_{name}"):
+            raise AttributeError(name)
+
+        def command(*args, **kwargs):
+            self._round_trip()
+            with self._cond:
+                return self._call(name, *args, **kwargs)
+
+        return command
+
+    def blmove(self, source, destination, timeout, src="RIGHT", dest="LEFT"):
+        self._round_trip()
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                value = self._lmove(source, destination, src, dest)
+                remaining = deadline - time.monotonic()
+                if value is not None or remaining <= 0:
+                    return value
+                self._cond.wait(remaining)
+
+    def scan_iter(self, match="*"):
+        prefix = match.rstrip("*")
+        with self._cond:
+            keys = [key for key in self._data if key.startswith(prefix)]
+        return iter(keys)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, client: FakeRedis):
+        self._client = client
+        self._commands = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._commands = []
+        return False
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self._commands.append((name, args, kwargs))
+            return self
+
+        return queue
+
+    def execute(self):
+        self._client._round_trip()
+        with self._client._cond:
+            results = [self._client._call(name, *a, **kw) for name, a, kw in self._commands]
+        self._commands = []
+        return results
+
+
+class FakeDatabase:
+    """In-memory `inputs` / `processed_jobs` with a simulated round-trip latency."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.inputs = []
+        self.processed = 0
+        self._lock = threading.Lock()
+
+    def _round_trip(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def insert(self, values):
+        self._round_trip()
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            first = len(self.inputs) + 1
+            self.inputs.extend((first + n, value, now) for n, value in enumerate(values))
+        return list(range(first, first + len(values)))
+
+    def select(self, limit, before_id=None, after=None, before=None):
+        self._round_trip()
+        with self._lock:
+            end = len(self.inputs) if before_id is None else min(before_id - 1, len(self.inputs))
+            rows = []
+            for index in range(end - 1, -1, -1):
+                row = self.inputs[index]
+                if after is not None and row[2] < after:
+                    continue
+                if before is not None and row[2] >= before:
+                    continue
+                rows.append(row)
+                if len(rows) == limit:
+                    break
+        return rows
+
+    # worker.py talks to a psycopg2 connection; this is just enough of one.
+
+    @property
+    def closed(self):
+        return 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeCursor:
+    def __init__(self, db: FakeDatabase):
+        self._db = db
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self._db._round_trip()
+        if "processed_jobs" in sql:
+            with self._db._lock:
+                self._db.processed += len(params[0])
+
+
+def install_fakes(pg_latency: float, redis_latency: float):
+    """Point main.py and worker.py at the in-memory stand-ins."""
+    db = FakeDatabase(pg_latency)
+    fake_redis = FakeRedis(redis_latency)
+
+    main.get_redis_client = lambda: fake_redis
+    main.write_to_db = lambda text: (db.insert([text]), "Input written to Postgres")[1]
+    main.write_many_to_db = db.insert
+    main.read_from_db = db.select
+    main._schema_checked_pid = os.getpid()
+    main.applied_schema_version = main.SCHEMA_VERSION
+    main.PostgresCheck = lambda: (lambda: None)
+    main.redis_check = lambda: fake_redis.ping
+
+    worker.get_redis_client = lambda: fake_redis
+    worker.get_pg_connection = lambda: db
+    return db, fake_redis
+
+
+# Load generation --------------------------------------------------------------
+
+
+def percentiles(samples: list) -> dict:
+    if not samples:
+        return {"p50": None, "p95": None, "p99": None, "max": None, "mean": None}
+    ordered = sorted(samples)
+
+    def pick(pct):
+        return round(ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))] * 1000, 3)
+
+    return {
+        "p50": pick(50),
+        "p95": pick(95),
+        "p99": pick(99),
+        "max": round(ordered[-1] * 1000, 3),
+        "mean": round(sum(ordered) / len(ordered) * 1000, 3),
+    }
+
+
+def run_http(base_url: str, scenario: str, concurrency: int, duration: float) -> dict:
+    """Closed-loop load: `concurrency` clients send requests back to back for `duration`."""
+    target = urlsplit(base_url)
+    post_ratio = {"post": 1.0, "get": 0.0, "mixed": 0.1}[scenario]
+    stop_at = time.perf_counter() + duration
+    latencies = [[] for _ in range(concurrency)]
+    errors = [0] * concurrency
+
+    def client(slot: int):
+        conn = http.client.HTTPConnection(target.hostname, target.port, timeout=30)
+        rng = random.Random(slot)
+        sent = 0
+        while time.perf_counter() < stop_at:
+            if rng.random() < post_ratio:
+                body = json.dumps({"text": f"bench-{slot}-{sent}"})
+                args = ("POST", "/api/messages", body, {"Content-Type": "application/json"})
+            else:
+                args = ("GET", GET_PATH)
+            started = time.perf_counter()
+            try:
+                conn.request(*args)
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 400:
+                    errors[slot] += 1
+            except (OSError, http.client.HTTPException):
+                errors[slot] += 1
+                conn.close()
+            latencies[slot].append(time.perf_counter() - started)
+            sent += 1
+        conn.close()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    samples = [sample for slot in latencies for sample in slot]
+    return {
+        "requests": len(samples),
+        "errors": sum(errors),
+        "duration_s": round(elapsed, 3),
+        "rps": round(len(samples) / elapsed, 1),
+        "latency_ms": percentiles(samples),
+    }
+
+
+def run_worker_drain(jobs: int, consumers: int, batch_size: int, linger_ms: float) -> dict:
+    """Preload `jobs` jobs, then drain them with worker.pop_batch / store_batch."""
+    r = worker.get_redis_client()
+    r.delete("jobs")
+    for first in range(0, jobs, 1000):
+        r.lpush("jobs", *(f"bench-job-{n}" for n in range(first, min(first + 1000, jobs))))
+
+    worker.WORKER_BLOCK_TIMEOUT = 0.2
+    batch_latencies = [[] for _ in range(consumers)]
+    drained = [0] * consumers
+    finished = [0.0] * consumers
+
+    def consume(slot: int):
+        processing_key = f"{worker.PROCESSING_PREFIX}bench:{slot}"
+        conn = worker.get_pg_connection()
+        while True:
+            started = time.perf_counter()
+            batch = worker.pop_batch(r, processing_key, batch_size, linger_ms)
+            if not batch:
+                break
+            worker.store_batch(conn, batch)
+            r.delete(processing_key)
+            finished[slot] = time.perf_counter()
+            batch_latencies[slot].append(finished[slot] - started)
+            drained[slot] += len(batch)
+        conn.close()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=consume, args=(n,)) for n in range(consumers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Stop the clock at the last commit, not after the final empty poll.
+    elapsed = max(finished) - started if any(finished) else 0.0
+
+    samples = [sample for slot in batch_latencies for sample in slot]
+    total = sum(drained)
+    return {
+        "jobs": total,
+        "batches": len(samples),
+        "duration_s": round(elapsed, 3),
+        "jobs_per_s": round(total / elapsed, 1) if elapsed else None,
+        "batch_latency_ms": percentiles(samples),
+    }
+
+
+def seed_messages(base_url: str, count: int):
+    target = urlsplit(base_url)
+    conn = http.client.HTTPConnection(target.hostname, target.port, timeout=60)
+    for first in range(0, count, 1000):
+        body = json.dumps({"messages": [f"seed-{n}" for n in range(first, min(first + 1000, count))]})
+        conn.request("POST", "/api/messages/batch", body, {"Content-Type": "application/json"})
+        conn.getresponse().read()
+    conn.close()
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scenario", choices=SCENARIOS + ("all",))
+    parser.add_argument("--backend", choices=("fake", "local"), default="fake")
+    parser.add_argument("--url", help="Benchmark an already running app instead of starting one")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per HTTP scenario")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent HTTP clients / drain consumers")
+    parser.add_argument("--seed", type=int, default=1000, help="Messages inserted before HTTP scenarios")
+    parser.add_argument("--jobs", type=int, default=50000, help="Jobs preloaded for worker-drain")
+    parser.add_argument("--batch-size", type=int, default=worker.WORKER_BATCH_SIZE)
+    parser.add_argument("--linger-ms", type=float, default=worker.WORKER_LINGER_MS)
+    parser.add_argument("--pg-latency-ms", type=float, default=0.5, help="Simulated Postgres round trip (fake backend)")
+    parser.add_argument("--redis-latency-ms", type=float, default=0.1, help="Simulated Redis round trip (fake backend)")
+    parser.add_argument("--output", help="Write JSON results here instead of stdout")
+    parser.add_argument("--log-level", default="WARNING", help="Log level for the app, worker and server loggers")
+    args = parser.parse_args()
+
+    # Per-request INFO lines would otherwise dominate what is being measured.
+    for name in ("app", "worker", "werkzeug"):
+        logging.getLogger(name).setLevel(args.log_level)
+
+    if args.backend == "fake":
+        install_fakes(args.pg_latency_ms / 1000, args.redis_latency_ms / 1000)
+
+    scenarios = SCENARIOS if args.scenario == "all" else (args.scenario,)
+    server = None
+    base_url = args.url
+    if base_url is None and any(s != "worker-drain" for s in scenarios):
+        server = make_server("127.0.0.1", 0, main.app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_port}"
+    if base_url and args.seed:
+        seed_messages(base_url, args.seed)
+
+    results = []
+    for scenario in scenarios:
+        print(f"Running {scenario}...", file=sys.stderr)
+        if scenario == "worker-drain":
+            outcome = run_worker_drain(args.jobs, args.concurrency, args.batch_size, args.linger_ms)
+        else:
+            outcome = run_http(base_url, scenario, args.concurrency, args.duration)
+        results.append({"scenario": scenario, **outcome})
+
+    if server is not None:
+        server.shutdown()
+
+    report = {
+        "commit": git_commit(),
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "backend": args.backend,
+        "url": args.url,
+        "config": {
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "seed": args.seed,
+            "jobs": args.jobs,
+            "batch_size": args.batch_size,
+            "linger_ms": args.linger_ms,
+            "pg_latency_ms": args.pg_latency_ms if args.backend == "fake" else None,
+            "redis_latency_ms": args.redis_latency_ms if args.backend == "fake" else None,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -1,6 +1,8 @@
 import argparse
+import multiprocessing
 import random
 import string
+import time
 
 import psycopg2
 
@@ -23,7 +25,7 @@ def get_pg_connection(
 
 def random_string(length: int = 16) -> str:
     alphabet = string.ascii_lowercase + string.digits
-    return "".join(random.choice(alphabet) for _ in range(length))
+    return "".join(random.choices(alphabet, k=length))
 
 
 def ensure_schema(conn):
@@ -45,15 +47,127 @@ def ensure_schema(conn):
     conn.commit()
 
 
-def generate_inputs(conn, count: int, prefix: str):
+def generate_inputs(conn, count: int, prefix: str, quiet: bool = False):
     cur = conn.cursor()
     for i in range(count):
         value = f"{prefix}-{i}-{random_string(8)}"
         cur.execute("INSERT INTO inputs (value) VALUES (%s)", (value,))
-        print(f"INSERT INTO inputs (value) VALUES ('{value}')")
+        if not quiet:
+            print(f"INSERT INTO inputs (value) VALUES ('{value}')")
     conn.commit()
 
 
+# COPY text format: backslash, tab and newlines must be escaped
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def iter_rows(start: int, stop: int, prefix: str):
+    """Yield COPY-ready lines for rows start..stop-1, one at a time."""
+    prefix = prefix.translate(_COPY_ESCAPES)
+    for i in range(start, stop):
+        yield f"{prefix}-{i}-{random_string(8)}\n"
+
+
+class ChunkedRowStream:
+    """
+    File-like adapter so COPY ... FROM STDIN can pull rows straight from a
+    generator. Each read() joins at most chunk_size rows, so memory stays
+    constant however many rows are streamed.
+    """
+
+    def __init__(self, rows, chunk_size: int, on_chunk=None):
+        self._rows = rows
+        self._chunk_size = chunk_size
+        self._on_chunk = on_chunk
+        self._buffer = ""
+
+    def _next_chunk(self) -> str:
+        lines = []
+        for line in self._rows:
+            lines.append(line)
+            if len(lines) >= self._chunk_size:
+                break
+        if lines and self._on_chunk:
+            self._on_chunk(len(lines))
+        return "".join(lines)
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self._buffer) < size:
+            chunk = self._next_chunk()
+            if not chunk:
+                break
+            self._buffer += chunk
+        if size < 0:
+            data, self._buffer = self._buffer, ""
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def copy_inputs(conn_kwargs: dict, start: int, stop: int, prefix: str, chunk_size: int, progress=None):
+    """Stream rows start..stop-1 into inputs with a single COPY on its own connection."""
+
+    def on_chunk(rows: int):
+        if progress is not None:
+            with progress.get_lock():
+                progress.value += rows
+
+    conn = get_pg_connection(**conn_kwargs)
+    try:
+        cur = conn.cursor()
+        stream = ChunkedRowStream(iter_rows(start, stop, prefix), chunk_size, on_chunk)
+        cur.copy_expert("COPY inputs (value) FROM STDIN", stream, size=1 << 16)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def bulk_generate_inputs(conn_kwargs: dict, count: int, prefix: str, workers: int,
+                         chunk_size: int, progress_interval: float):
+    """
+    Split count across `workers` processes, each running its own COPY, and
+    print a rows/sec progress line every progress_interval seconds.
+    """
+    workers = max(1, min(workers, count or 1))
+    progress = multiprocessing.Value("q", 0)
+    step, remainder = divmod(count, workers)
+    processes = []
+    start = 0
+    for n in range(workers):
+        stop = start + step + (1 if n < remainder else 0)
+        process = multiprocessing.Process(
+            target=copy_inputs,
+            args=(conn_kwargs, start, stop, prefix, chunk_size, progress),
+        )
+        process.start()
+        processes.append(process)
+        start = stop
+
+    started = last_time = time.monotonic()
+    last_rows = 0
+    while any(p.is_alive() for p in processes):
+        for p in processes:
+            p.join(timeout=progress_interval / len(processes))
+        now = time.monotonic()
+        if now - last_time >= progress_interval:
+            rows = progress.value
+            print(
+                f"{rows}/{count} rows "
+                f"({(rows - last_rows) / (now - last_time):,.0f} rows/s)",
+                flush=True,
+            )
+            last_time, last_rows = now, rows
+
+    elapsed = time.monotonic() - started
+    failed = [p.exitcode for p in processes if p.exitcode != 0]
+    if failed:
+        raise SystemExit(f"{len(failed)} of {workers} loader processes failed")
+    print(
+        f"Loaded {count} rows in {elapsed:.1f}s "
+        f"({count / elapsed if elapsed else 0:,.0f} rows/s) with {workers} workers"
+    )
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--host", default="db")
@@ -63,24 +177,39 @@ def main():
     parser.add_argument("--password", default="postgres")
     parser.add_argument("--count", type=int, default=20)
     parser.add_argument("--prefix", default="lab-message")
+    parser.add_argument("--bulk", action="store_true", help="Load with streaming COPY instead of per-row INSERTs")
+    parser.add_argument("--workers", type=int, default=1, help="Parallel COPY processes in --bulk mode")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="Rows generated per COPY chunk")
+    parser.add_argument("--progress-interval", type=float, default=2.0, help="Seconds between progress lines")
+    parser.add_argument("--quiet", action="store_true", help="Don't print every generated row")
     args = parser.parse_args()
 
-    conn = get_pg_connection(
+    conn_kwargs = dict(
         host=args.host,
         port=args.port,
         database=args.database,
         user=args.user,
         password=args.password,
     )
-
+    conn = get_pg_connection(**conn_kwargs)
     ensure_schema(conn)
-    generate_inputs(conn, args.count, args.prefix)
 
-    conn.close()
+    if args.bulk:
+        conn.close()
+        bulk_generate_inputs(
+            conn_kwargs,
+            args.count,
+            args.prefix,
+            args.workers,
+            args.chunk_size,
+            args.progress_interval,
+        )
+    else:
+        generate_inputs(conn, args.count, args.prefix, quiet=args.quiet)
+        conn.close()
+
     print("Done. Check Adminer or psql to see the new rows in inputs.")
 
 
 if __name__ == "__main__":
     main()
-
-
@@ -1,4 +1,5 @@
 import argparse
+import multiprocessing
 import random
 import string
 import time
@@ -14,31 +15,132 @@ def random_string(length: int = 8) -> str:
     return "".join(random.choices(string.ascii_lowercase + string.digits, k=length))
 
 
-def generate_strings(r: redis.Redis, prefix: str, count: int):
-    for i in range(count):
-        key = f"{prefix}:{i}"
-        value = random_string(16)
-        r.set(key, value)
-        print(f"SET {key} = {value}")
-
-
-def generate_list(r: redis.Redis, key: str, count: int):
-    for _ in range(count):
-        value = random_string(12)
-        r.rpush(key, value)
-        print(f"RPUSH {key} {value}")
-
-
-def generate_hashes(r: redis.Redis, prefix: str, count: int):
-    for i in range(count):
-        key = f"{prefix}:{i}"
-        fields = {
-            "id": str(i),
-            "value": random_string(10),
-            "created_at": str(time.time()),
-        }
-        r.hset(key, mapping=fields)
-        print(f"HSET {key} {fields}")
+# Each generator yields batches of (items, commands) where commands is a list of
+# (method, args, kwargs) to queue on one pipeline. `items` is the number of
+# keys/values the batch writes, which is what throughput is reported in.
+
+
+def generate_strings(prefix: str, start: int, stop: int, batch_size: int):
+    for first in range(start, stop, batch_size):
+        last = min(first + batch_size, stop)
+        commands = [
+            ("set", (f"{prefix}:{i}", random_string(16)), {}) for i in range(first, last)
+        ]
+        yield last - first, commands
+
+
+def generate_list(key: str, start: int, stop: int, batch_size: int):
+    # One variadic RPUSH per batch instead of one command per value
+    for first in range(start, stop, batch_size):
+        last = min(first + batch_size, stop)
+        values = [random_string(12) for _ in range(first, last)]
+        yield last - first, [("rpush", (key, *values), {})]
+
+
+def generate_hashes(prefix: str, start: int, stop: int, batch_size: int):
+    for first in range(start, stop, batch_size):
+        last = min(first + batch_size, stop)
+        commands = [
+            (
+                "hset",
+                (f"{prefix}:{i}",),
+                {
+                    "mapping": {
+                        "id": str(i),
+                        "value": random_string(10),
+                        "created_at": str(time.time()),
+                    }
+                },
+            )
+            for i in range(first, last)
+        ]
+        yield last - first, commands
+
+
+class Pacer:
+    """
+    Open-loop rate control: batches are scheduled at fixed times derived from
+    the target rate, whether or not earlier ones have finished, and latency is
+    measured from the scheduled time so a stalled server shows up in the tail
+    (no coordinated omission).
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self.next_at = time.perf_counter()
+
+    def wait(self, items: int) -> float:
+        scheduled = self.next_at
+        self.next_at += items * self.interval
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        return scheduled
+
+
+def run_batches(r: redis.Redis, batches, pacer=None, quiet: bool = False):
+    """Send every batch as one pipeline; return (items, elapsed, latencies)."""
+    items = 0
+    latencies = []
+    started = time.perf_counter()
+    for count, commands in batches:
+        sent_at = pacer.wait(count) if pacer else time.perf_counter()
+        pipe = r.pipeline(transaction=False)
+        for method, args, kwargs in commands:
+            getattr(pipe, method)(*args, **kwargs)
+        pipe.execute()
+        latencies.append(time.perf_counter() - sent_at)
+        items += count
+        if not quiet:
+            for method, args, kwargs in commands:
+                print(method.upper(), *args, *kwargs.values())
+    return items, time.perf_counter() - started, latencies
+
+
+def run_worker(options: dict, start: int, stop: int) -> dict:
+    """Generate keys start..stop-1 of every kind on this process' own connection."""
+    r = get_redis_client(options["host"], options["port"])
+    pacer = Pacer(options["rate"]) if options["rate"] else None
+    batch_size = options["pipeline"]
+    quiet = options["quiet"]
+    phases = [
+        ("strings", generate_strings(options["prefix"], start, stop, batch_size)),
+        ("list", generate_list(options["list_key"], start, stop, batch_size)),
+        ("hashes", generate_hashes(options["hash_prefix"], start, stop, batch_size)),
+    ]
+    results = {}
+    for name, batches in phases:
+        if not quiet:
+            print(f"\nGenerating {name}...")
+        results[name] = run_batches(r, batches, pacer, quiet)
+    return results
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def report(results: list, wall_time: float):
+    total_items = 0
+    for name in ("strings", "list", "hashes"):
+        items = sum(result[name][0] for result in results)
+        elapsed = max(result[name][1] for result in results)
+        latencies = sorted(lat for result in results for lat in result[name][2])
+        total_items += items
+        print(
+            f"{name:>8}: {items} items in {elapsed:.2f}s "
+            f"({items / elapsed if elapsed else 0:,.0f}/s), pipeline latency "
+            f"p50={percentile(latencies, 50) * 1000:.2f}ms "
+            f"p95={percentile(latencies, 95) * 1000:.2f}ms "
+            f"p99={percentile(latencies, 99) * 1000:.2f}ms"
+        )
+    print(
+        f"   total: {total_items} items in {wall_time:.2f}s "
+        f"({total_items / wall_time if wall_time else 0:,.0f}/s)"
+    )
 
 
 def main():
@@ -49,23 +151,44 @@ def main():
     parser.add_argument("--prefix", default="lab:string")
     parser.add_argument("--list-key", default="lab:list")
     parser.add_argument("--hash-prefix", default="lab:hash")
+    parser.add_argument("--pipeline", type=int, default=100, help="Commands/values sent per round trip")
+    parser.add_argument("--workers", type=int, default=1, help="Processes sharing the count")
+    parser.add_argument("--rate", type=float, default=0, help="Target items/sec across all workers (0 = as fast as possible)")
+    parser.add_argument("--quiet", action="store_true", help="Don't print every generated key")
     args = parser.parse_args()
 
-    r = get_redis_client(args.host, args.port)
-
-    print("Generating string keys...")
-    generate_strings(r, args.prefix, args.count)
-
-    print("\nGenerating list entries...")
-    generate_list(r, args.list_key, args.count)
-
-    print("\nGenerating hashes...")
-    generate_hashes(r, args.hash_prefix, args.count)
-
+    workers = max(1, min(args.workers, args.count or 1))
+    options = {
+        "host": args.host,
+        "port": args.port,
+        "prefix": args.prefix,
+        "list_key": args.list_key,
+        "hash_prefix": args.hash_prefix,
+        "pipeline": max(1, args.pipeline),
+        "rate": args.rate / workers if args.rate else 0,
+        "quiet": args.quiet or workers > 1,
+    }
+
+    step, remainder = divmod(args.count, workers)
+    ranges = []
+    start = 0
+    for n in range(workers):
+        stop = start + step + (1 if n < remainder else 0)
+        ranges.append((options, start, stop))
+        start = stop
+
+    started = time.perf_counter()
+    if workers == 1:
+        results = [run_worker(*ranges[0])]
+    else:
+        with multiprocessing.Pool(workers) as pool:
+            results = pool.starmap(run_worker, ranges)
+    wall_time = time.perf_counter() - started
+
+    print()
+    report(results, wall_time)
     print("\nDone. Check Redis Commander to inspect the data.")
 
 
 if __name__ == "__main__":
     main()
-
-
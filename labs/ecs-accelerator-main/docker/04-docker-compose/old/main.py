@@ -1,88 +1,396 @@
+import base64
+import json
 import logging
+import math
 import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
 from datetime import datetime
 
 import psycopg2
 import redis
-from flask import Flask, jsonify, request
+from flask import Flask, g, jsonify, request
 
+import app_metrics
+import metrics
+from app_metrics import BACKEND_ERRORS, BACKEND_SECONDS, HTTP_SECONDS
 
-def get_pg_connection():
+
+# Default hostnames match the service names in docker-compose.yml; override
+# them to point the app at local Postgres/Redis (e.g. for bench.py).
+PG_HOST = os.getenv("PG_HOST", "db")
+REDIS_HOST = os.getenv("REDIS_HOST", "redis")
+
+# Pool sizing is per process: with gunicorn, every worker gets its own pools,
+# so PG_POOL_MAX * workers must stay below Postgres' max_connections.
+PG_POOL_MIN = int(os.getenv("PG_POOL_MIN", "1"))
+PG_POOL_MAX = int(os.getenv("PG_POOL_MAX", "10"))
+PG_POOL_TIMEOUT = float(os.getenv("PG_POOL_TIMEOUT", "5"))
+PG_POOL_VALIDATE_AFTER = float(os.getenv("PG_POOL_VALIDATE_AFTER", "30"))
+# Bounds opening a pooled connection, so a hung database fails the checkout
+# instead of blocking the request thread. libpq rounds values below 2 up to 2.
+PG_CONNECT_TIMEOUT = int(os.getenv("PG_CONNECT_TIMEOUT", "2"))
+REDIS_POOL_MAX = int(os.getenv("REDIS_POOL_MAX", "20"))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "5"))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", "30"))
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "5000"))
+# The stale window is bounded by this TTL: a reader that queried Postgres just
+# before a write can repopulate an entry right after the write invalidated it.
+FEED_CACHE_TTL = int(os.getenv("FEED_CACHE_TTL", "30"))
+FEED_CACHE_LOCK_MS = int(os.getenv("FEED_CACHE_LOCK_MS", "2000"))
+FEED_CACHE_KEYS = [f"feed:{limit}" for limit in range(1, 101)]
+# Dependencies are probed in the background every HEALTH_INTERVAL seconds with
+# HEALTH_TIMEOUT per check; probe endpoints only read the cached result.
+HEALTH_INTERVAL = float(os.getenv("HEALTH_INTERVAL", "5"))
+HEALTH_TIMEOUT = float(os.getenv("HEALTH_TIMEOUT", "1"))
+
+
+def get_pg_connection(**options):
     """
     Connect to Postgres running in Docker Compose.
     Hostname matches the service name in docker-compose.yml.
+    Extra libpq options (timeouts, keepalives) are passed through.
     """
     return psycopg2.connect(
-        host="db",
+        host=PG_HOST,
         port=5432,
         database="postgres",
         user="postgres",
         password="postgres",
+        **options,
     )
 
 
+class PoolTimeout(Exception):
+    """Raised when no pooled connection frees up within the checkout timeout."""
+
+
+class PgPool:
+    """
+    Small thread-safe Postgres connection pool.
+
+    Connections are validated on borrow: closed or broken connections are
+    dropped, and connections idle for longer than ``validate_after`` seconds
+    are pinged with ``SELECT 1`` before being handed out.
+    """
+
+    def __init__(self, connect, minconn=1, maxconn=10, timeout=5.0, validate_after=30.0):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError("expected 0 <= minconn <= maxconn and maxconn >= 1")
+        self._connect = connect
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.validate_after = validate_after
+        self._cond = threading.Condition()
+        self._idle = []  # list of (conn, returned_at), most recently used last
+        self._in_use = 0
+        self._waits = 0
+        self._wait_seconds = 0.0
+        self._max_wait_seconds = 0.0
+        self._timeouts = 0
+        self._discarded = 0
+
+    def prefill(self):
+        """Open connections until ``minconn`` are idle, so the first requests skip the handshake."""
+        while True:
+            with self._cond:
+                if len(self._idle) + self._in_use >= self.minconn:
+                    return
+            conn = self._connect()
+            with self._cond:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+
+    def _is_usable(self, conn, returned_at):
+        if conn.closed:
+            return False
+        if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        if time.monotonic() - returned_at < self.validate_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _close_quietly(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def getconn(self):
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+        with self._cond:
+            while not self._idle and self._in_use >= self.maxconn:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeout(
+                        f"no Postgres connection available after {self.timeout}s "
+                        f"(max={self.maxconn})"
+                    )
+                waited = True
+                self._cond.wait(remaining)
+            if waited:
+                elapsed = time.monotonic() - started
+                self._waits += 1
+                self._wait_seconds += elapsed
+                self._max_wait_seconds = max(self._max_wait_seconds, elapsed)
+            entry = self._idle.pop() if self._idle else None
+            self._in_use += 1
+
+        # Validation and connecting happen outside the lock so a slow
+        # database never blocks other threads returning connections.
+        try:
+            while entry is not None:
+                conn, returned_at = entry
+                if self._is_usable(conn, returned_at):
+                    return conn
+                self._close_quietly(conn)
+                with self._cond:
+                    self._discarded += 1
+                    entry = self._idle.pop() if self._idle else None
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+    def putconn(self, conn, discard=False):
+        if not discard and not conn.closed:
+            try:
+                if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+        with self._cond:
+            self._in_use -= 1
+            if discard or conn.closed:
+                self._discarded += 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+                conn = None
+            self._cond.notify()
+        if conn is not None:
+            self._close_quietly(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        try:
+            yield conn
+        except BaseException:
+            self.putconn(conn, discard=bool(conn.closed))
+            raise
+        else:
+            self.putconn(conn)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "min": self.minconn,
+                "max": self.maxconn,
+                "waits": self._waits,
+                "wait_seconds_total": round(self._wait_seconds, 6),
+                "wait_seconds_max": round(self._max_wait_seconds, 6),
+                "timeouts": self._timeouts,
+                "discarded": self._discarded,
+            }
+
+    def closeall(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+
+_pools_lock = threading.Lock()
+_pools_pid = None
+_pg_pool = None
+_redis_pool = None
+
+
+def _ensure_pools():
+    """
+    Create the process-wide pools lazily, and again after a fork, so each
+    gunicorn worker owns its own sockets instead of sharing the master's.
+    No connections are opened here; see ensure_schema() for the warm-up.
+    """
+    global _pools_pid, _pg_pool, _redis_pool
+    if _pools_pid == os.getpid():
+        return
+    with _pools_lock:
+        if _pools_pid == os.getpid():
+            return
+        _pg_pool = PgPool(
+            lambda: get_pg_connection(connect_timeout=PG_CONNECT_TIMEOUT),
+            minconn=PG_POOL_MIN,
+            maxconn=PG_POOL_MAX,
+            timeout=PG_POOL_TIMEOUT,
+            validate_after=PG_POOL_VALIDATE_AFTER,
+        )
+        _redis_pool = redis.BlockingConnectionPool(
+            host=REDIS_HOST,
+            port=6379,
+            db=0,
+            decode_responses=True,
+            max_connections=REDIS_POOL_MAX,
+            timeout=REDIS_POOL_TIMEOUT,
+            health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+        )
+        _pools_pid = os.getpid()
+
+
+@contextmanager
+def pg_connection():
+    """Borrow a connection from the process-wide Postgres pool."""
+    _ensure_pools()
+    with _pg_pool.connection() as conn:
+        yield conn
+
+
 def get_redis_client():
     """
     Connect to Redis running in Docker Compose.
     Hostname matches the service name in docker-compose.yml.
+    The client shares the process-wide blocking connection pool.
     """
-    return redis.Redis(host="redis", port=6379, db=0, decode_responses=True)
+    _ensure_pools()
+    return redis.Redis(connection_pool=_redis_pool)
 
 
-def write_to_db(user_input: str) -> str:
-    conn = get_pg_connection()
-    cursor = conn.cursor()
+def pool_stats():
+    _ensure_pools()
+    created = len(getattr(_redis_pool, "_connections", []))
+    idle = sum(1 for c in getattr(_redis_pool.pool, "queue", []) if c is not None)
+    return {
+        "pid": os.getpid(),
+        "postgres": _pg_pool.stats(),
+        "redis": {
+            "in_use": created - idle,
+            "idle": idle,
+            "max": _redis_pool.max_connections,
+        },
+    }
 
-    # Ensure table exists (initial lab run)
-    cursor.execute(
-        """
-        CREATE TABLE IF NOT EXISTS inputs (
-            id SERIAL PRIMARY KEY,
-            value TEXT NOT NULL
-        )
-        """
-    )
 
-    # Simple "auto-migration" for the lab: add created_at if it isn't there yet
-    cursor.execute(
-        """
-        ALTER TABLE inputs
-        ADD COLUMN IF NOT EXISTS created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-        """
-    )
-
-    cursor.execute("INSERT INTO inputs (value) VALUES (%s)", (user_input,))
-    conn.commit()
-    conn.close()
+@metrics.timed(BACKEND_SECONDS, BACKEND_ERRORS, "postgres", "write_to_db")
+def write_to_db(user_input: str) -> str:
+    with pg_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO inputs (value) VALUES (%s)", (user_input,))
+        conn.commit()
     logging.getLogger("app").info(
         "Inserted message into Postgres", extra={"value": user_input}
     )
     return "Input written to Postgres"
 
 
-def read_from_db(limit: int = 10):
-    conn = get_pg_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT id, value, created_at FROM inputs ORDER BY id DESC LIMIT %s", (limit,)
+@metrics.timed(BACKEND_SECONDS, BACKEND_ERRORS, "postgres", "write_many_to_db")
+def write_many_to_db(user_inputs: list) -> list:
+    """
+    Insert a batch in a single statement and return the new ids in input order.
+    unnest(... WITH ORDINALITY) keeps one bound array parameter no matter the batch
+    size; ids come from the serial in ORDER BY order, so sorting them lines them
+    up with the inputs even if other writers interleave.
+    """
+    with pg_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            INSERT INTO inputs (value)
+            SELECT value FROM unnest(%s::text[]) WITH ORDINALITY AS batch(value, n)
+            ORDER BY n
+            RETURNING id
+            """,
+            (list(user_inputs),),
+        )
+        ids = sorted(row[0] for row in cursor.fetchall())
+        conn.commit()
+    logging.getLogger("app").info(
+        "Inserted message batch into Postgres", extra={"count": len(ids)}
     )
-    result = cursor.fetchall()
-    conn.close()
+    return ids
+
+
+@metrics.timed(BACKEND_SECONDS, BACKEND_ERRORS, "postgres", "read_from_db")
+def read_from_db(limit: int = 10, before_id=None, after=None, before=None):
+    """
+    Newest-first page of inputs. Paging is keyset-based (id < before_id), so a
+    deep page walks the primary key index exactly like the first one;
+    after/before bound created_at and use inputs_created_at_id_idx.
+    """
+    conditions = []
+    params = []
+    if before_id is not None:
+        conditions.append("id < %s")
+        params.append(before_id)
+    if after is not None:
+        conditions.append("created_at >= %s")
+        params.append(after)
+    if before is not None:
+        conditions.append("created_at < %s")
+        params.append(before)
+    where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+    params.append(limit)
+
+    with pg_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            f"SELECT id, value, created_at FROM inputs {where}ORDER BY id DESC LIMIT %s",
+            params,
+        )
+        result = cursor.fetchall()
+        conn.rollback()
     return result
 
 
+@metrics.timed(BACKEND_SECONDS, BACKEND_ERRORS, "redis", "write_to_redis")
 def write_to_redis(user_input: str) -> str:
     r = get_redis_client()
     # Store last input and bump a counter so students can see Redis state
     r.set("last_input", user_input)
     r.incr("input_count")
     r.lpush("jobs", user_input)
+    r.delete(*FEED_CACHE_KEYS)
     logging.getLogger("app").info(
         "Pushed job to Redis list", extra={"value": user_input}
     )
     return "Input written to Redis"
 
 
+@metrics.timed(BACKEND_SECONDS, BACKEND_ERRORS, "redis", "write_many_to_redis")
+def write_many_to_redis(user_inputs: list) -> str:
+    """
+    Same state changes as write_to_redis for every input, sent as one MULTI/EXEC
+    round trip: LPUSH with many values keeps the per-message push order.
+    """
+    r = get_redis_client()
+    with r.pipeline(transaction=True) as pipe:
+        pipe.set("last_input", user_inputs[-1])
+        pipe.incrby("input_count", len(user_inputs))
+        pipe.lpush("jobs", *user_inputs)
+        pipe.delete(*FEED_CACHE_KEYS)
+        pipe.execute()
+    logging.getLogger("app").info(
+        "Pushed job batch to Redis list", extra={"count": len(user_inputs)}
+    )
+    return "Batch written to Redis"
+
+
+@metrics.timed(BACKEND_SECONDS, BACKEND_ERRORS, "redis", "read_from_redis")
 def read_from_redis():
     r = get_redis_client()
     last = r.get("last_input")
@@ -90,6 +398,237 @@ def read_from_redis():
     return {"last_input": last, "input_count": int(count) if count else 0}
 
 
+class SingleFlight:
+    """
+    Collapse concurrent calls for the same key into one execution per process;
+    the other callers block and share its result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {"done": threading.Event()}
+        if not leader:
+            call["done"].wait()
+            if "error" in call:
+                raise call["error"]
+            return call["result"], True
+
+        try:
+            call["result"] = fn()
+        except BaseException as exc:
+            call["error"] = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call["done"].set()
+        return call["result"], False
+
+
+# Only delete the fill lock if we still own it (it may have expired and been retaken).
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+_feed_flight = SingleFlight()
+_cache_stats_lock = threading.Lock()
+cache_stats = {"hits": 0, "misses": 0, "coalesced": 0, "lock_waits": 0, "errors": 0}
+
+
+def _count(name: str):
+    with _cache_stats_lock:
+        cache_stats[name] += 1
+
+
+def _fill_feed(r, key: str, build):
+    """
+    Cross-process single flight: only the holder of key:lock queries Postgres,
+    other gunicorn workers poll the cache until it appears (or the lock expires).
+    """
+    lock_key = f"{key}:lock"
+    token = uuid.uuid4().hex
+    if not r.set(lock_key, token, nx=True, px=FEED_CACHE_LOCK_MS):
+        deadline = time.monotonic() + FEED_CACHE_LOCK_MS / 1000
+        while time.monotonic() < deadline:
+            time.sleep(0.01)
+            body = r.get(key)
+            if body is not None:
+                _count("lock_waits")
+                return body
+        # The holder died or is very slow; build it ourselves.
+
+    try:
+        body = build()
+        r.set(key, body, ex=FEED_CACHE_TTL)
+    finally:
+        r.eval(_RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+    return body
+
+
+def read_feed_cached(limit: int, build) -> str:
+    """
+    Read-through cache of the serialized newest-N feed, keyed by limit. Writers
+    delete FEED_CACHE_KEYS; misses are coalesced so only one DB query runs.
+    """
+    key = f"feed:{limit}"
+    r = get_redis_client()
+    try:
+        body = r.get(key)
+    except redis.RedisError:
+        _count("errors")
+        return build()
+    if body is not None:
+        _count("hits")
+        return body
+
+    _count("misses")
+    try:
+        body, shared = _feed_flight.do(key, lambda: _fill_feed(r, key, build))
+    except redis.RedisError:
+        _count("errors")
+        return build()
+    if shared:
+        _count("coalesced")
+    return body
+
+
+class DependencyProbe:
+    """
+    Runs `check` every `interval` seconds on its own daemon thread and caches
+    the outcome. Each dependency has its own thread, so a hung backend only
+    makes its own result stale. Readers get the latest state dict by reference
+    (swapped atomically), so serving a probe never blocks or touches the network.
+    """
+
+    def __init__(self, name: str, check, interval: float):
+        self.name = name
+        self.interval = interval
+        self._check = check
+        self._state = {
+            "ok": False,
+            "latency_ms": None,
+            "checked_at": None,
+            "last_success": None,
+            "error": "not checked yet",
+        }
+        self._thread = threading.Thread(target=self._run, name=f"probe-{name}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            started = time.perf_counter()
+            try:
+                self._check()
+                error = None
+            except Exception as exc:
+                error = str(exc).strip() or exc.__class__.__name__
+            elapsed = time.perf_counter() - started
+            now = time.time()
+            self._state = {
+                "ok": error is None,
+                "latency_ms": round(elapsed * 1000, 3),
+                "checked_at": now,
+                "last_success": now if error is None else self._state["last_success"],
+                "error": error,
+            }
+            time.sleep(max(0.0, self.interval - elapsed))
+
+    def snapshot(self, now: float) -> dict:
+        state = self._state
+        checked_at = state["checked_at"]
+        # A check stuck past its timeout stops refreshing checked_at
+        stale = checked_at is None or now - checked_at > 3 * self.interval
+        return {
+            "ok": state["ok"] and not stale,
+            "stale": stale,
+            "latency_ms": state["latency_ms"],
+            "checked_at": _iso(checked_at),
+            "last_success": _iso(state["last_success"]),
+            "error": state["error"] if not stale else "probe result is stale",
+        }
+
+
+def _iso(timestamp):
+    return datetime.fromtimestamp(timestamp).astimezone().isoformat() if timestamp else None
+
+
+class PostgresCheck:
+    """SELECT 1 over one long-lived probe connection, separate from the request pool."""
+
+    def __init__(self):
+        self._conn = None
+
+    def __call__(self):
+        if self._conn is None or self._conn.closed:
+            self._conn = get_pg_connection(
+                connect_timeout=max(2, math.ceil(HEALTH_TIMEOUT)),  # libpq minimum is 2s
+                options=f"-c statement_timeout={int(HEALTH_TIMEOUT * 1000)}",
+                keepalives=1,
+                keepalives_idle=max(1, int(HEALTH_INTERVAL)),
+                keepalives_interval=1,
+                keepalives_count=2,
+            )
+        try:
+            with self._conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            self._conn.rollback()
+        except Exception:
+            self._conn.close()
+            self._conn = None
+            raise
+
+
+def redis_check():
+    client = redis.Redis(
+        host=REDIS_HOST,
+        port=6379,
+        db=0,
+        socket_timeout=HEALTH_TIMEOUT,
+        socket_connect_timeout=HEALTH_TIMEOUT,
+    )
+    return client.ping
+
+
+_probes_pid = None
+_probes = {}
+_started_at = time.time()
+
+
+def ensure_prober():
+    """Start the probe threads once per process (threads don't survive a fork)."""
+    global _probes_pid, _probes
+    if _probes_pid == os.getpid():
+        return
+    with _pools_lock:
+        if _probes_pid == os.getpid():
+            return
+        _probes = {
+            "postgres": DependencyProbe("postgres", PostgresCheck(), HEALTH_INTERVAL),
+            "redis": DependencyProbe("redis", redis_check(), HEALTH_INTERVAL),
+        }
+        for probe in _probes.values():
+            probe.start()
+        _probes_pid = os.getpid()
+
+
+def health_snapshot() -> dict:
+    ensure_prober()
+    now = time.time()
+    return {name: probe.snapshot(now) for name, probe in _probes.items()}
+
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s %(levelname)s %(name)s %(message)s",
@@ -100,32 +639,181 @@ logger = logging.getLogger("app")
 app = Flask(__name__)
 
 
-def run_migrations():
-    """
-    Simple migration function used by both the app and the one-shot migrate service.
-    """
-    conn = get_pg_connection()
-    cursor = conn.cursor()
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request(response):
+    started = g.get("request_started")
+    if started is not None:
+        # Label by URL rule, not path, to keep the series count bounded.
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        HTTP_SECONDS.labels(request.method, route, response.status_code).observe(
+            time.perf_counter() - started
+        )
+    return response
+
+
+@app.errorhandler(PoolTimeout)
+def pool_exhausted(exc):
+    """No pooled Postgres connection freed up in time: tell the client to retry."""
+    logger.warning("%s", exc)
+    response = jsonify({"error": str(exc)})
+    response.status_code = 503
+    response.headers["Retry-After"] = "1"
+    return response
+
 
-    cursor.execute(
+# Ordered, append-only list of (version, description, SQL). Never edit a step
+# that has shipped; add a new one with the next version number instead.
+MIGRATIONS = [
+    (
+        1,
+        "create inputs table",
         """
         CREATE TABLE IF NOT EXISTS inputs (
             id SERIAL PRIMARY KEY,
             value TEXT NOT NULL
         )
-        """
-    )
-
-    cursor.execute(
+        """,
+    ),
+    (
+        2,
+        "add inputs.created_at",
         """
         ALTER TABLE inputs
         ADD COLUMN IF NOT EXISTS created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        """,
+    ),
+    (
+        3,
+        "create processed_jobs table",
         """
-    )
+        CREATE TABLE IF NOT EXISTS processed_jobs (
+            id SERIAL PRIMARY KEY,
+            payload TEXT NOT NULL,
+            processed_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        )
+        """,
+    ),
+    (
+        4,
+        "index inputs.created_at for time-range paging",
+        """
+        CREATE INDEX IF NOT EXISTS inputs_created_at_id_idx
+        ON inputs (created_at, id)
+        """,
+    ),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
 
-    conn.commit()
-    conn.close()
-    logger.info("Migrations applied to inputs table")
+# Arbitrary key for pg_advisory_xact_lock so concurrent migrators
+# (the migrate service and app replicas) apply steps one at a time.
+MIGRATION_LOCK_ID = 4_041_001
+
+_schema_checked_pid = None
+applied_schema_version = None
+
+
+def current_schema_version(cursor) -> int:
+    cursor.execute("SELECT to_regclass('schema_version') IS NOT NULL")
+    if not cursor.fetchone()[0]:
+        return 0
+    cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    return cursor.fetchone()[0]
+
+
+def run_migrations() -> int:
+    """
+    Apply pending migrations in order, used by both the app and the one-shot migrate service.
+    Every step runs in one transaction together with its schema_version row.
+    """
+    with pg_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            )
+            """
+        )
+        current = current_schema_version(cursor)
+
+        for version, description, sql in MIGRATIONS:
+            if version <= current:
+                continue
+            cursor.execute(sql)
+            cursor.execute(
+                "INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                (version, description),
+            )
+            logger.info("Applied migration %s: %s", version, description)
+            current = version
+
+        conn.commit()
+    logger.info("Schema is at version %s", current)
+    return current
+
+
+def ensure_schema() -> int:
+    """
+    Startup check, done once per process: read the applied schema version and
+    migrate if the database is behind. Request paths only run DML after this.
+    """
+    global _schema_checked_pid, applied_schema_version
+    if _schema_checked_pid == os.getpid():
+        return applied_schema_version
+
+    # Connecting anyway, so warm the pool up to PG_POOL_MIN here rather than
+    # when the pools are created (pool_stats() creates them without network I/O)
+    _ensure_pools()
+    _pg_pool.prefill()
+    with pg_connection() as conn:
+        version = current_schema_version(conn.cursor())
+        conn.rollback()
+    if version < SCHEMA_VERSION:
+        logger.info(
+            "Schema at version %s, expected %s; migrating", version, SCHEMA_VERSION
+        )
+        version = run_migrations()
+    elif version > SCHEMA_VERSION:
+        logger.warning(
+            "Database schema version %s is newer than this app (%s)",
+            version,
+            SCHEMA_VERSION,
+        )
+
+    applied_schema_version = version
+    _schema_checked_pid = os.getpid()
+    return version
+
+
+@app.before_request
+def start_prober():
+    ensure_prober()
+
+
+# Served from memory (the landing page and probe/inspection endpoints): never
+# run the schema check (or anything else that can wait on Postgres or Redis)
+# in front of these.
+NO_DB_ENDPOINTS = {"index", "livez", "readyz", "health", "metrics_endpoint", "pool", "cache"}
+
+
+@app.before_request
+def check_schema():
+    if request.endpoint in NO_DB_ENDPOINTS:
+        return
+    try:
+        ensure_schema()
+    except Exception as exc:
+        # Leave it to the route to fail (or report) if the DB is unreachable;
+        # the check is retried on the next request.
+        logger.warning("Schema check failed: %s", exc)
 
 
 @app.route("/")
@@ -138,8 +826,12 @@ def index():
         "<p>This app is running in the <code>app</code> service.</p>"
         "<ul>"
         "<li>POST a message to <code>/api/messages</code></li>"
+        "<li>POST many messages to <code>/api/messages/batch</code></li>"
         "<li>View recent messages at <code>/api/messages</code> (GET)</li>"
-        "<li>Check health at <code>/api/health</code></li>"
+        "<li>Check health at <code>/api/health</code>, <code>/livez</code> and <code>/readyz</code></li>"
+        "<li>Inspect connection pools at <code>/api/pool</code></li>"
+        "<li>Inspect feed cache counters at <code>/api/cache</code></li>"
+        "<li>Scrape Prometheus metrics at <code>/metrics</code></li>"
         "</ul>"
     )
 
@@ -161,15 +853,67 @@ def create_message():
     )
 
 
-@app.route("/api/messages", methods=["GET"])
-def list_messages():
-    limit_param = request.args.get("limit", "10")
-    try:
-        limit = max(1, min(int(limit_param), 100))
-    except ValueError:
-        limit = 10
+@app.route("/api/messages/batch", methods=["POST"])
+def create_messages_batch():
+    """
+    Accepts {"messages": ["a", "b", ...]} (or objects with a "text" key) and
+    writes them with one Postgres statement and one Redis transaction.
+    """
+    data = request.get_json(silent=True)
+    messages = data.get("messages") if isinstance(data, dict) else None
+    if not isinstance(messages, list) or not messages:
+        return jsonify({"error": "expected a non-empty 'messages' list"}), 400
+    if len(messages) > MAX_BATCH_SIZE:
+        return (
+            jsonify({"error": f"batch too large (max {MAX_BATCH_SIZE} messages)"}),
+            413,
+        )
+
+    texts = []
+    for index, message in enumerate(messages):
+        text = message.get("text") if isinstance(message, dict) else message
+        if not isinstance(text, str) or not text:
+            return jsonify({"error": f"message {index} has no text"}), 400
+        texts.append(text)
+
+    ids = write_many_to_db(texts)
+    redis_msg = write_many_to_redis(texts)
+
+    return jsonify(
+        {
+            "count": len(texts),
+            "items": [{"id": id_, "text": text} for id_, text in zip(ids, texts)],
+            "postgres": f"{len(ids)} inputs written to Postgres",
+            "redis": redis_msg,
+        }
+    )
+
+
+def encode_cursor(state: dict) -> str:
+    raw = json.dumps(state, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+    state = json.loads(raw)
+    if not isinstance(state, dict):
+        raise ValueError("cursor is not an object")
+    return state
+
+
+def parse_timestamp(value):
+    if value is None:
+        return None
+    # Cursors are client-supplied JSON, so after/before may be any type
+    if not isinstance(value, str):
+        raise ValueError("timestamp must be an ISO 8601 string")
+    # Accept the "Z" suffix that JavaScript's toISOString() produces.
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
 
-    rows = read_from_db(limit=limit)
+def build_messages_page(limit, before_id, after, before, state) -> str:
+    rows = read_from_db(limit=limit, before_id=before_id, after=after, before=before)
     items = [
         {
             "id": row[0],
@@ -182,25 +926,133 @@ def list_messages():
     ]
     redis_state = read_from_redis()
 
-    return jsonify({"messages": items, "redis": redis_state})
+    next_cursor = None
+    if len(rows) == limit:
+        next_cursor = encode_cursor(
+            {
+                "before_id": rows[-1][0],
+                "after": state.get("after"),
+                "before": state.get("before"),
+            }
+        )
+
+    return app.json.dumps(
+        {"messages": items, "redis": redis_state, "next_cursor": next_cursor}
+    )
+
+
+@app.route("/api/messages", methods=["GET"])
+def list_messages():
+    """
+    Newest-first messages with keyset pagination.
+
+    Query params: limit (1-100), before_id, after / before (ISO timestamps on
+    created_at), or cursor (the opaque next_cursor of a previous page, which
+    carries the filters along). Responses carry an ETag so pollers can send
+    If-None-Match and get a 304 when nothing changed. The unfiltered first
+    page is served from the Redis feed cache (see read_feed_cached).
+    """
+    limit_param = request.args.get("limit", "10")
+    try:
+        limit = max(1, min(int(limit_param), 100))
+    except ValueError:
+        limit = 10
+
+    try:
+        if "cursor" in request.args:
+            state = decode_cursor(request.args["cursor"])
+        else:
+            state = {
+                "before_id": request.args.get("before_id"),
+                "after": request.args.get("after"),
+                "before": request.args.get("before"),
+            }
+        before_id = int(state["before_id"]) if state.get("before_id") is not None else None
+        after = parse_timestamp(state.get("after"))
+        before = parse_timestamp(state.get("before"))
+    except (ValueError, TypeError, OverflowError):
+        return jsonify({"error": "invalid cursor, before_id, after or before"}), 400
+
+    def build():
+        return build_messages_page(limit, before_id, after, before, state)
+
+    if before_id is None and after is None and before is None:
+        body = read_feed_cached(limit, build)
+    else:
+        body = build()
+
+    response = app.response_class(body, mimetype="application/json")
+    response.headers["Cache-Control"] = "no-cache"
+    response.add_etag()
+    return response.make_conditional(request)
 
 
 @app.route("/api/health", methods=["GET"])
 def health():
-    try:
-        # Simple checks to show both services are reachable
-        conn = get_pg_connection()
-        conn.cursor().execute("SELECT 1")
-        conn.close()
+    """
+    Served from the background prober's cache, so it never opens connections.
+    """
+    checks = health_snapshot()
+    failing = [f"{name}: {check['error']}" for name, check in checks.items() if not check["ok"]]
+    status = f"error: {'; '.join(failing)}" if failing else "ok"
+    return jsonify({"status": status, "schema_version": applied_schema_version})
+
+
+@app.route("/livez", methods=["GET"])
+def livez():
+    """
+    Liveness: the process is up and serving. Deliberately ignores dependencies
+    so a database outage doesn't get every app container restarted.
+    """
+    return jsonify(
+        {"status": "ok", "pid": os.getpid(), "uptime": round(time.time() - _started_at, 3)}
+    )
+
+
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    """
+    Readiness: every dependency passed its latest (fresh) background check.
+    """
+    checks = health_snapshot()
+    ready = all(check["ok"] for check in checks.values())
+    return (
+        jsonify({"status": "ready" if ready else "not ready", "checks": checks}),
+        200 if ready else 503,
+    )
+
+
+def cache_stats_snapshot():
+    with _cache_stats_lock:
+        return dict(cache_stats)
+
+
+# Runs for whichever copy of this module is imported last (asgi.py's `main` in
+# async mode), so /metrics reads the state the serving code actually uses.
+app_metrics.pool_stats_provider = pool_stats
+app_metrics.health_provider = health_snapshot
+app_metrics.cache_stats_provider = cache_stats_snapshot
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return app.response_class(metrics.render(), content_type=metrics.CONTENT_TYPE)
 
-        r = get_redis_client()
-        r.ping()
 
-        status = "ok"
-    except Exception as exc:  # pragma: no cover - demo only
-        status = f"error: {exc}"
+@app.route("/api/pool", methods=["GET"])
+def pool():
+    """
+    Per-process pool usage, handy for sizing PG_POOL_MAX per gunicorn worker.
+    """
+    return jsonify(pool_stats())
 
-    return jsonify({"status": status})
+
+@app.route("/api/cache", methods=["GET"])
+def cache():
+    """
+    Per-process hit/miss counters for the recent-messages feed cache.
+    """
+    return jsonify(cache_stats_snapshot())
 
 
 if __name__ == "__main__":
@@ -211,7 +1063,24 @@ if __name__ == "__main__":
     if mode == "migrate":
         logger.info("Running migrations in one-shot mode")
         run_migrations()
+    elif mode == "async":
+        # Same routes on asyncpg + redis.asyncio; see asgi.py
+        import uvicorn
+
+        logger.info("Starting ASGI web server", extra={"mode": mode})
+        uvicorn.run(
+            "asgi:app",
+            host="0.0.0.0",
+            port=8000,
+            workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+            log_level="info",
+        )
     else:
+        ensure_prober()
+        try:
+            ensure_schema()
+        except Exception as exc:
+            logger.warning("Schema check at startup failed: %s", exc)
         # Bind to 0.0.0.0 so Docker can expose port 8000
         logger.info("Starting Flask web server", extra={"mode": mode})
         app.run(host="0.0.0.0", port=8000)
\ No newline at end of file
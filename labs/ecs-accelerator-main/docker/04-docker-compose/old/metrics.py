@@ -0,0 +1,302 @@
+"""
+Tiny in-process metrics registry with Prometheus text exposition.
+
+Used by main.py, asgi.py and worker.py. Every counter and histogram child is
+split into STRIPES shards, handed out round-robin to threads, each with its
+own lock, so request threads rarely contend and a scrape only ever holds one
+shard lock at a time (never a global lock). Histograms use fixed buckets.
+"""
+
+import bisect
+import functools
+import inspect
+import itertools
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STRIPES = 16
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; covers sub-millisecond Redis calls up to multi-second stalls.
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+# Each thread gets the next stripe index on first use. Thread ids are pthread_t
+# addresses on Linux, 16-byte aligned, so get_ident() % STRIPES is always 0.
+_stripe_counter = itertools.count()
+_thread_stripe = threading.local()
+
+
+def _stripe_index() -> int:
+    index = getattr(_thread_stripe, "index", None)
+    if index is None:
+        index = _thread_stripe.index = next(_stripe_counter) % STRIPES
+    return index
+
+
+class _Striped:
+    """A fixed-width row of numbers, sharded by thread."""
+
+    def __init__(self, width: int):
+        self._stripes = [(threading.Lock(), [0] * width) for _ in range(STRIPES)]
+
+    def stripe(self):
+        return self._stripes[_stripe_index()]
+
+    def snapshot(self) -> list:
+        total = None
+        for lock, values in self._stripes:
+            with lock:
+                row = list(values)
+            total = row if total is None else [a + b for a, b in zip(total, row)]
+        return total
+
+
+class _CounterChild:
+    def __init__(self):
+        self._values = _Striped(1)
+
+    def inc(self, amount=1):
+        lock, values = self._values.stripe()
+        with lock:
+            values[0] += amount
+
+    def value(self):
+        return self._values.snapshot()[0]
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self._buckets = buckets
+        # One slot per bucket, one for +Inf, then sum and count.
+        self._values = _Striped(len(buckets) + 3)
+
+    def observe(self, value, count=1):
+        index = bisect.bisect_left(self._buckets, value)
+        lock, values = self._values.stripe()
+        with lock:
+            values[index] += count
+            values[-2] += value * count
+            values[-1] += count
+
+    def time(self):
+        return _Timer(self)
+
+    def snapshot(self):
+        values = self._values.snapshot()
+        return values[:-2], values[-2], values[-1]
+
+
+class _Timer:
+    def __init__(self, child):
+        self._child = child
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._child.observe(time.perf_counter() - self._started)
+        return False
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            # A second family with the same name makes Prometheus reject the
+            # whole scrape, e.g. when a module defining metrics is imported twice
+            if any(metric.name == name for metric in _registry):
+                raise ValueError(f"metric {name!r} is already registered")
+            _registry.append(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _label_text(self, key, extra=()):
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ""
+        body = ",".join(f'{name}="{_escape(value)}"' for name, value in pairs)
+        return "{" + body + "}"
+
+    def render(self) -> list:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for key, child in list(self._children.items()):
+            lines.extend(self._render_child(key, child))
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def _render_child(self, key, child):
+        return [f"{self.name}{self._label_text(key)} {_number(child.value())}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value, count=1):
+        self.labels().observe(value, count)
+
+    def time(self):
+        return self.labels().time()
+
+    def _render_child(self, key, child):
+        counts, total, count = child.snapshot()
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            le = "+Inf" if bound == float("inf") else _number(bound)
+            lines.append(
+                f"{self.name}_bucket{self._label_text(key, [('le', le)])} {cumulative}"
+            )
+        lines.append(f"{self.name}_sum{self._label_text(key)} {_number(total)}")
+        lines.append(f"{self.name}_count{self._label_text(key)} {count}")
+        return lines
+
+
+class Callback(_Metric):
+    """
+    Values read from a function at scrape time, e.g. pool sizes. `fn` returns
+    {label-values tuple: number}.
+    """
+
+    def __init__(self, name, documentation, fn, labelnames=(), kind="gauge"):
+        self.kind = kind
+        self._fn = fn
+        super().__init__(name, documentation, labelnames)
+
+    def render(self) -> list:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        try:
+            values = self._fn()
+        except Exception:
+            return lines
+        for key, value in values.items():
+            key = tuple(str(v) for v in key)
+            lines.append(f"{self.name}{self._label_text(key)} {_number(value)}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value) -> str:
+    if isinstance(value, float):
+        return repr(value) if value != int(value) else str(int(value))
+    return str(value)
+
+
+def render() -> str:
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def timed(histogram: Histogram, errors: Counter, *labelvalues):
+    """
+    Decorator recording the call's duration in `histogram` and failures in
+    `errors`, both under `labelvalues`. Works for plain and async functions.
+    """
+    child = histogram.labels(*labelvalues)
+    error_child = errors.labels(*labelvalues)
+
+    def decorate(fn):
+        if inspect.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                except BaseException:
+                    error_child.inc()
+                    raise
+                finally:
+                    child.observe(time.perf_counter() - started)
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            except BaseException:
+                error_child.inc()
+                raise
+            finally:
+                child.observe(time.perf_counter() - started)
+
+        return wrapper
+
+    return decorate
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serve /metrics from a daemon thread (the worker's sidecar listener)."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
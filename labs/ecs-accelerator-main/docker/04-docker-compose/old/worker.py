@@ -1,13 +1,23 @@
 import logging
+import multiprocessing
+import os
+import signal
+import socket
 import time
 
 import psycopg2
 import redis
 
+import metrics
+
+
+PG_HOST = os.getenv("PG_HOST", "db")
+REDIS_HOST = os.getenv("REDIS_HOST", "redis")
+
 
 def get_pg_connection():
     return psycopg2.connect(
-        host="db",
+        host=PG_HOST,
         port=5432,
         database="postgres",
         user="postgres",
@@ -16,7 +26,7 @@ def get_pg_connection():
 
 
 def get_redis_client():
-    return redis.Redis(host="redis", port=6379, db=0, decode_responses=True)
+    return redis.Redis(host=REDIS_HOST, port=6379, db=0, decode_responses=True)
 
 
 logging.basicConfig(
@@ -25,42 +35,323 @@ logging.basicConfig(
 )
 logger = logging.getLogger("worker")
 
+# Up to WORKER_BATCH_SIZE jobs are stored per INSERT/transaction. After the
+# blocking pop the worker waits at most WORKER_LINGER_MS for the batch to fill.
+WORKER_BATCH_SIZE = int(os.getenv("WORKER_BATCH_SIZE", "100"))
+WORKER_LINGER_MS = float(os.getenv("WORKER_LINGER_MS", "10"))
+WORKER_STATS_INTERVAL = float(os.getenv("WORKER_STATS_INTERVAL", "10"))
 
-def main():
-    r = get_redis_client()
-    logger.info("Worker started, waiting for jobs on 'jobs' list")
+# Reliable delivery: every worker process moves jobs into its own processing
+# list and deletes it only after the Postgres commit. A worker that stops
+# refreshing its heartbeat key is considered dead and the reaper (run by the
+# supervisor) pushes its processing list back onto `jobs`.
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "0")) or os.cpu_count() or 1
+WORKER_BLOCK_TIMEOUT = float(os.getenv("WORKER_BLOCK_TIMEOUT", "2"))
+WORKER_HEARTBEAT_TTL = int(os.getenv("WORKER_HEARTBEAT_TTL", "30"))
+WORKER_REAP_INTERVAL = float(os.getenv("WORKER_REAP_INTERVAL", "15"))
+WORKER_SHUTDOWN_TIMEOUT = float(os.getenv("WORKER_SHUTDOWN_TIMEOUT", "20"))
+# Each worker process serves /metrics on WORKER_METRICS_PORT + its slot; 0 disables.
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "9100"))
+PROCESSING_PREFIX = "jobs:processing:"
+HEARTBEAT_PREFIX = "jobs:heartbeat:"
 
+BATCH_SECONDS = metrics.Histogram(
+    "worker_batch_duration_seconds",
+    "Time to store and acknowledge one batch.",
+)
+JOB_SECONDS = metrics.Histogram(
+    "worker_job_duration_seconds",
+    "Per-job processing time (batch duration amortized over its jobs).",
+)
+BATCH_SIZE = metrics.Histogram(
+    "worker_batch_size",
+    "Jobs per batch.",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+JOBS = metrics.Counter(
+    "worker_jobs_total",
+    "Jobs by outcome (stored or requeued after an error).",
+    ["outcome"],
+)
+LOOP_ERRORS = metrics.Counter("worker_loop_errors_total", "Errors in the worker loop.")
+
+# Move everything from KEYS[1] back to the consuming (right) end of KEYS[2]
+# in one atomic step; the oldest job ends up rightmost, so it is popped first.
+REQUEUE_SCRIPT = """
+local moved = 0
+while redis.call('lmove', KEYS[1], KEYS[2], 'LEFT', 'RIGHT') do
+    moved = moved + 1
+end
+return moved
+"""
+
+
+def check_schema():
+    """
+    Startup check, done once per process. The processed_jobs table is created
+    by the migrations in main.py (the one-shot `migrate` service), so the job
+    loop itself only runs DML.
+    """
     while True:
         try:
-            _, payload = r.brpop("jobs")
-            logger.info("Worker received job", extra={"payload": payload})
-
-            # Optional: record that the job was processed in Postgres
             conn = get_pg_connection()
             cur = conn.cursor()
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS processed_jobs (
-                    id SERIAL PRIMARY KEY,
-                    payload TEXT NOT NULL,
-                    processed_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-                )
-                """
-            )
-            cur.execute(
-                "INSERT INTO processed_jobs (payload) VALUES (%s)",
-                (payload,),
-            )
-            conn.commit()
+            cur.execute("SELECT to_regclass('schema_version') IS NOT NULL")
+            if cur.fetchone()[0]:
+                cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+                version = cur.fetchone()[0]
+            else:
+                version = 0
+            cur.execute("SELECT to_regclass('processed_jobs') IS NOT NULL")
+            ready = cur.fetchone()[0]
             conn.close()
+        except Exception as exc:
+            logger.error("Schema check failed", exc_info=exc)
+            time.sleep(1)
+            continue
+
+        if ready:
+            logger.info("Database schema is at version %s", version)
+            return version
+        logger.warning(
+            "processed_jobs table missing (schema version %s); "
+            "waiting for `python main.py migrate`",
+            version,
+        )
+        time.sleep(1)
+
+
+def pop_batch(r, processing_key: str, batch_size: int, linger_ms: float) -> list:
+    """
+    Wait up to WORKER_BLOCK_TIMEOUT for a first job, then move up to
+    batch_size - 1 more, waiting at most linger_ms for stragglers. Every job is
+    moved (not popped) into processing_key so a crash can't lose it. Returns an
+    empty list when the queue stayed empty, so callers can heartbeat and check
+    for shutdown.
+    """
+    first = r.blmove("jobs", processing_key, WORKER_BLOCK_TIMEOUT, "RIGHT", "LEFT")
+    if first is None:
+        return []
+    batch = [first]
+    deadline = time.monotonic() + linger_ms / 1000
+
+    while len(batch) < batch_size:
+        with r.pipeline(transaction=False) as pipe:
+            for _ in range(batch_size - len(batch)):
+                pipe.lmove("jobs", processing_key, "RIGHT", "LEFT")
+            more = [job for job in pipe.execute() if job is not None]
+        if more:
+            batch.extend(more)
+            continue
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        job = r.blmove("jobs", processing_key, remaining, "RIGHT", "LEFT")
+        if job is None:
+            break
+        batch.append(job)
+
+    return batch
+
+
+def store_batch(conn, batch: list):
+    """Record the whole batch with one statement in one transaction."""
+    with conn.cursor() as cur:
+        cur.execute(
+            "INSERT INTO processed_jobs (payload) SELECT unnest(%s::text[])",
+            (batch,),
+        )
+    conn.commit()
+
+
+def requeue(r, processing_key: str) -> int:
+    return r.eval(REQUEUE_SCRIPT, 2, processing_key, "jobs")
+
+
+def reap_stuck_jobs(r) -> int:
+    """Requeue the processing lists of workers whose heartbeat has expired."""
+    requeued = 0
+    for key in r.scan_iter(match=f"{PROCESSING_PREFIX}*"):
+        worker_id = key[len(PROCESSING_PREFIX):]
+        if r.exists(f"{HEARTBEAT_PREFIX}{worker_id}"):
+            continue
+        moved = requeue(r, key)
+        if moved:
+            logger.warning("Requeued %d stuck jobs from dead worker %s", moved, worker_id)
+        requeued += moved
+    return requeued
+
+
+class BatchStats:
+    """Throughput and batch-size numbers, logged every WORKER_STATS_INTERVAL seconds."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._reset(time.monotonic())
+
+    def _reset(self, now: float):
+        self.started = now
+        self.jobs = 0
+        self.batches = 0
+        self.max_batch = 0
 
-            logger.info("Worker stored processed job in Postgres")
+    def record(self, size: int):
+        self.jobs += size
+        self.batches += 1
+        self.max_batch = max(self.max_batch, size)
+        now = time.monotonic()
+        elapsed = now - self.started
+        if elapsed >= self.interval:
+            logger.info(
+                "Worker throughput: %.1f jobs/s, %d jobs in %d batches "
+                "(avg %.1f, max %d) over %.1fs",
+                self.jobs / elapsed,
+                self.jobs,
+                self.batches,
+                self.jobs / self.batches,
+                self.max_batch,
+                elapsed,
+            )
+            self._reset(now)
+
+
+def run_worker(worker_id: str, slot: int = 0):
+    """
+    One worker process: pop a batch into its processing list, store it in
+    Postgres, then acknowledge by deleting the list. SIGTERM lets the current
+    batch commit and ack before the process exits.
+    """
+    stopping = False
+
+    def request_stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    if WORKER_METRICS_PORT:
+        metrics.start_http_server(WORKER_METRICS_PORT + slot)
+
+    r = get_redis_client()
+    processing_key = f"{PROCESSING_PREFIX}{worker_id}"
+    heartbeat_key = f"{HEARTBEAT_PREFIX}{worker_id}"
+    conn = None
+    stats = BatchStats(WORKER_STATS_INTERVAL)
+
+    # Jobs left over from a previous process in this slot were never acked.
+    recovered = requeue(r, processing_key)
+    if recovered:
+        logger.warning("Requeued %d unacknowledged jobs from %s", recovered, processing_key)
+    logger.info(
+        "Worker %s started, waiting for jobs on 'jobs' list",
+        worker_id,
+        extra={"batch_size": WORKER_BATCH_SIZE, "linger_ms": WORKER_LINGER_MS},
+    )
+
+    while not stopping:
+        try:
+            r.set(heartbeat_key, os.getpid(), ex=WORKER_HEARTBEAT_TTL)
+            batch = pop_batch(r, processing_key, WORKER_BATCH_SIZE, WORKER_LINGER_MS)
+            if not batch:
+                continue
+            logger.debug("Worker received %d jobs", len(batch))
+
+            started = time.perf_counter()
+            # One long-lived connection, reopened only after a failure
+            if conn is None or conn.closed:
+                conn = get_pg_connection()
+            store_batch(conn, batch)
+            r.delete(processing_key)
+            elapsed = time.perf_counter() - started
+
+            BATCH_SECONDS.observe(elapsed)
+            JOB_SECONDS.observe(elapsed / len(batch), count=len(batch))
+            BATCH_SIZE.observe(len(batch))
+            JOBS.labels("stored").inc(len(batch))
+            stats.record(len(batch))
         except Exception as exc:
             logger.error("Worker loop error", exc_info=exc)
+            LOOP_ERRORS.inc()
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+                conn = None
+            try:
+                JOBS.labels("requeued").inc(requeue(r, processing_key))
+            except Exception as requeue_exc:
+                logger.error("Could not requeue %s", processing_key, exc_info=requeue_exc)
             time.sleep(1)
 
+    r.delete(heartbeat_key)
+    if conn is not None:
+        conn.close()
+    logger.info("Worker %s stopped", worker_id)
 
-if __name__ == "__main__":
-    main()
+
+def start_worker(slot: int) -> multiprocessing.Process:
+    # hostname:slot is stable across restarts of the same container, so a
+    # restarted slot picks up its own unacknowledged jobs right away.
+    worker_id = f"{socket.gethostname()}:{slot}"
+    process = multiprocessing.Process(
+        target=run_worker, args=(worker_id, slot), name=f"worker-{slot}"
+    )
+    process.start()
+    return process
+
+
+def supervise(processes: int):
+    """
+    Fork `processes` workers sharing the `jobs` queue, restart any that die,
+    run the reaper, and on SIGTERM stop them gracefully.
+    """
+    stopping = False
+
+    def request_stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    r = get_redis_client()
+    children = {slot: start_worker(slot) for slot in range(processes)}
+    logger.info("Supervisor started %d worker processes", processes)
+    next_reap = time.monotonic() + WORKER_REAP_INTERVAL
+
+    while not stopping:
+        for slot, process in list(children.items()):
+            if not process.is_alive():
+                logger.warning(
+                    "Worker %s exited with code %s; restarting", slot, process.exitcode
+                )
+                children[slot] = start_worker(slot)
+        if time.monotonic() >= next_reap:
+            try:
+                reap_stuck_jobs(r)
+            except Exception as exc:
+                logger.error("Reaper error", exc_info=exc)
+            next_reap = time.monotonic() + WORKER_REAP_INTERVAL
+        time.sleep(0.5)
+
+    logger.info("Supervisor stopping %d worker processes", len(children))
+    for process in children.values():
+        process.terminate()
+    deadline = time.monotonic() + WORKER_SHUTDOWN_TIMEOUT
+    for process in children.values():
+        process.join(max(0.0, deadline - time.monotonic()))
+        if process.is_alive():
+            logger.warning("Worker %s did not stop in time; killing", process.name)
+            process.kill()
+            process.join()
+
+
+def main():
+    check_schema()
+    supervise(WORKER_PROCESSES)
 
 
+if __name__ == "__main__":
+    main()
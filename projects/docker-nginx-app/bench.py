@@ -0,0 +1,122 @@
+"""
+Compare main.py's serving engines.
+
+    python bench.py                                   # all engines, 10s each
+    python bench.py --engines threaded asyncio --connections 32 --duration 5
+    python bench.py --no-keepalive                    # new connection per request
+
+Each engine is started as a subprocess on a free local port and driven by
+--connections client processes, each looping GET / on its own connection
+for --duration seconds. Reports throughput and latency percentiles.
+"""
+import argparse
+import http.client
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"server on port {port} did not start")
+
+
+def client(args):
+    port, duration, keep_alive, path = args
+    latencies = []
+    errors = 0
+    conn = None
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            if conn is None:
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            conn.request("GET", path, headers={} if keep_alive else {"Connection": "close"})
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                errors += 1
+            if not keep_alive or response.will_close:
+                conn.close()
+                conn = None
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            if conn is not None:
+                conn.close()
+            conn = None
+            continue
+        latencies.append(time.perf_counter() - started)
+    if conn is not None:
+        conn.close()
+    return latencies, errors
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q / 100 * len(sorted_values)))]
+
+
+def run_engine(engine, opts):
+    port = free_port()
+    cmd = [sys.executable, os.path.join(HERE, "main.py"), "--engine", engine,
+           "--host", "127.0.0.1", "--port", str(port), "--workers", str(opts.workers)]
+    server = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port)
+        jobs = [(port, opts.duration, not opts.no_keepalive, opts.path)] * opts.connections
+        with multiprocessing.Pool(opts.connections) as pool:
+            results = pool.map(client, jobs)
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+    latencies = sorted(lat for lats, _ in results for lat in lats)
+    errors = sum(err for _, err in results)
+    return {
+        "engine": engine,
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / opts.duration,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--engines", nargs="+", default=["threaded", "prefork", "asyncio"],
+                        choices=["threaded", "prefork", "asyncio"])
+    parser.add_argument("--connections", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="prefork processes")
+    parser.add_argument("--path", default="/")
+    parser.add_argument("--no-keepalive", action="store_true", help="open a new connection per request")
+    opts = parser.parse_args()
+
+    print(f"{'engine':<10} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for engine in opts.engines:
+        r = run_engine(engine, opts)
+        print(f"{r['engine']:<10} {r['requests']:>9} {r['errors']:>7} {r['rps']:>9.0f} "
+              f"{r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,464 @@
-from http.server import BaseHTTPRequestHandler, HTTPServer
+"""
+Minimal HTTP/1.1 app server behind Nginx.
+
+    python main.py                            # threaded (default)
+    python main.py --engine prefork --workers 4
+    python main.py --engine asyncio
+
+All engines keep connections alive so Nginx's upstream keepalive pool is
+actually reused, and every reply is encoded once at import: serving a request
+is a single write of a prebuilt bytes object.
+
+Files under APP_STATIC_DIR (default ./static, if it exists) are served at
+/static/ with os.sendfile, ETag/Last-Modified revalidation, Range requests and
+gzip/brotli variants compressed once at startup.
+"""
+import argparse
+import asyncio
+import email.utils
+import gzip
+import mimetypes
+import os
+import posixpath
+import re
+import signal
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+try:
+    import brotli
+except ImportError:  # optional: only gzip variants without it
+    brotli = None
+
+MESSAGE = b"Hello, Hashim from app via Nginx!"
+
+STATIC_DIR = os.getenv("APP_STATIC_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "static"))
+STATIC_PREFIX = "/static/"
+# Seconds between re-stats of a cached file; 0 re-stats on every request
+STATIC_RECHECK = float(os.getenv("APP_STATIC_RECHECK", 2))
+STATIC_MAX_AGE = int(os.getenv("APP_STATIC_MAX_AGE", 0))
+# Larger files are always sent uncompressed with sendfile
+PRECOMPRESS_MAX_BYTES = int(os.getenv("APP_PRECOMPRESS_MAX_BYTES", 1024 * 1024))
+COMPRESSIBLE = re.compile(r"^(text/|application/(javascript|json|xml|wasm)|image/svg\+xml)")
+RANGE = re.compile(r"bytes=(\d*)-(\d*)")
+
+
+def encode_response(status, body, keep_alive, include_body=True, content_type="text/plain"):
+    head = (
+        f"HTTP/1.1 {status}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+        "\r\n"
+    ).encode("latin-1")
+    return head + body if include_body else head
+
+
+# (method, keep_alive) -> complete response bytes
+RESPONSES = {
+    (method, keep_alive): encode_response("200 OK", MESSAGE, keep_alive, include_body=method == b"GET")
+    for method in (b"GET", b"HEAD")
+    for keep_alive in (True, False)
+}
+NOT_IMPLEMENTED = encode_response("501 Not Implemented", b"", keep_alive=False)
+BAD_REQUEST = encode_response("400 Bad Request", b"", keep_alive=False)
+NOT_FOUND = {keep_alive: encode_response("404 Not Found", b"Not Found", keep_alive) for keep_alive in (True, False)}
+
+
+class StaticFile:
+    """Cached metadata (and compressed variants) for one file."""
+    __slots__ = ("path", "size", "mtime_ns", "etag", "last_modified", "content_type", "variants", "checked_at")
+
+    def __init__(self, path, st):
+        self.path = path
+        self.size = st.st_size
+        self.mtime_ns = st.st_mtime_ns
+        self.etag = f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+        self.last_modified = email.utils.formatdate(st.st_mtime, usegmt=True)
+        self.content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        self.checked_at = time.monotonic()
+        # coding -> (body, etag); each variant gets its own strong validator
+        self.variants = {}
+        if COMPRESSIBLE.match(self.content_type) and 0 < self.size <= PRECOMPRESS_MAX_BYTES:
+            with open(path, "rb") as f:
+                raw = f.read()
+            candidates = [("gzip", lambda: gzip.compress(raw, 9, mtime=0))]
+            if brotli is not None:
+                candidates.insert(0, ("br", lambda: brotli.compress(raw)))
+            for coding, compress in candidates:
+                body = compress()
+                if len(body) < self.size * 0.9:
+                    self.variants[coding] = (body, f'{self.etag[:-1]}-{coding}"')
+
+    def same_file(self, st):
+        return st.st_size == self.size and st.st_mtime_ns == self.mtime_ns
+
+
+class StaticFiles:
+    """
+    Serves a directory. Metadata is cached per file and only re-checked with
+    stat() every `recheck` seconds; everything under the root is loaded (and
+    compressed) once at startup.
+    """
+
+    def __init__(self, root, recheck=STATIC_RECHECK):
+        self.root = os.path.realpath(root)
+        self.recheck = recheck
+        self._files = {}
+        self._lock = threading.Lock()
+        for dirpath, _, names in os.walk(self.root):
+            for name in names:
+                rel = os.path.relpath(os.path.join(dirpath, name), self.root).replace(os.sep, "/")
+                self.lookup(rel)
+
+    def lookup(self, rel):
+        entry = self._files.get(rel)
+        if entry is not None and time.monotonic() - entry.checked_at < self.recheck:
+            return entry
+        path = os.path.realpath(os.path.join(self.root, rel))
+        if os.path.commonpath([self.root, path]) != self.root:
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            st = None
+        if st is None or not os.path.isfile(path):
+            with self._lock:
+                self._files.pop(rel, None)
+            return None
+        if entry is not None and entry.same_file(st):
+            entry.checked_at = time.monotonic()
+            return entry
+        entry = StaticFile(path, st)
+        with self._lock:
+            self._files[rel] = entry
+        return entry
+
+
+def static_path(target):
+    """'/static/css/a.css?v=1' -> 'css/a.css', or None if not a static request."""
+    path = unquote(target.split("?", 1)[0])
+    if not path.startswith(STATIC_PREFIX):
+        return None
+    rel = posixpath.normpath(path[len(STATIC_PREFIX):]).lstrip("/")
+    # A NUL (e.g. from %00) makes realpath()/stat() raise ValueError, not OSError
+    if rel in ("", ".") or rel.startswith("..") or "\x00" in rel:
+        return ""
+    return rel
+
+
+def accepted_codings(header):
+    codings = {}
+    for part in (header or "").split(","):
+        token, _, params = part.partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if token.strip():
+            codings[token.strip().lower()] = q
+    return codings
+
+
+def etag_matches(header, etag):
+    tags = [tag.strip() for tag in header.split(",")]
+    # Weak comparison, as RFC 9110 requires for If-None-Match
+    return "*" in tags or etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+
+def static_reply(entry, method, get_header, keep_alive):
+    """
+    Build the reply for a cached file: (head bytes, body bytes or None,
+    (path, offset, length) for sendfile or None).
+    """
+    coding = None
+    codings = accepted_codings(get_header("Accept-Encoding"))
+    for candidate in ("br", "gzip"):
+        if candidate in entry.variants and codings.get(candidate, codings.get("*", 0)) > 0:
+            coding = candidate
+            break
+    body, etag = entry.variants[coding] if coding else (None, entry.etag)
+
+    headers = [
+        ("ETag", etag),
+        ("Last-Modified", entry.last_modified),
+        ("Cache-Control", f"public, max-age={STATIC_MAX_AGE}" if STATIC_MAX_AGE else "no-cache"),
+        ("Connection", "keep-alive" if keep_alive else "close"),
+    ]
+    if entry.variants:
+        headers.append(("Vary", "Accept-Encoding"))
+
+    if_none_match = get_header("If-None-Match")
+    if_modified_since = get_header("If-Modified-Since")
+    not_modified = False
+    if if_none_match is not None:
+        not_modified = etag_matches(if_none_match, etag)
+    elif if_modified_since:
+        try:
+            since = email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+            not_modified = entry.mtime_ns // 1_000_000_000 <= since
+        except (TypeError, ValueError):
+            pass
+    if not_modified:
+        return head("304 Not Modified", headers), None, None
+
+    status = "200 OK"
+    offset, length = 0, entry.size
+    if coding:
+        headers.append(("Content-Encoding", coding))
+        length = len(body)
+    else:
+        headers.append(("Accept-Ranges", "bytes"))
+        requested = get_header("Range")
+        if_range = get_header("If-Range")
+        if requested and (not if_range or if_range in (etag, entry.last_modified)):
+            match = RANGE.fullmatch(requested.strip())
+            # Multiple ranges are not supported; those get the whole file
+            if match and match.group(1) + match.group(2):
+                first, last = match.groups()
+                if first:
+                    start, end = int(first), min(int(last), entry.size - 1) if last else entry.size - 1
+                else:
+                    start, end = max(entry.size - int(last), 0), entry.size - 1
+                if start > end or start >= entry.size:
+                    headers.append(("Content-Range", f"bytes */{entry.size}"))
+                    headers.append(("Content-Length", "0"))
+                    return head("416 Range Not Satisfiable", headers), None, None
+                status = "206 Partial Content"
+                offset, length = start, end - start + 1
+                headers.append(("Content-Range", f"bytes {start}-{end}/{entry.size}"))
+
+    headers.append(("Content-Type", entry.content_type))
+    headers.append(("Content-Length", str(length)))
+    if method == "HEAD":
+        return head(status, headers), None, None
+    if coding:
+        return head(status, headers), body, None
+    return head(status, headers), None, (entry.path, offset, length)
+
+
+def head(status, headers):
+    lines = [f"HTTP/1.1 {status}"] + [f"{name}: {value}" for name, value in headers]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+static_files = StaticFiles(STATIC_DIR) if os.path.isdir(STATIC_DIR) else None
+
+
+def route_static(target, method, get_header, keep_alive):
+    """The static reply for this request, or None if it is not a static path."""
+    if static_files is None:
+        return None
+    rel = static_path(target)
+    if rel is None:
+        return None
+    entry = static_files.lookup(rel) if rel else None
+    if entry is None:
+        return NOT_FOUND[keep_alive], None, None
+    return static_reply(entry, method, get_header, keep_alive)
+
 
 class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
     def do_GET(self):
-        msg = b"Hello, Hashim from app via Nginx!"
-        self.send_response(200)
-        self.send_header("Content-type", "text/plain")
-        self.send_header("Content-length", str(len(msg)))
-        self.end_headers()
-        self.wfile.write(msg)
+        reply = route_static(self.path, self.command, self.headers.get, not self.close_connection)
+        if reply is None:
+            self.wfile.write(RESPONSES[b"GET", not self.close_connection])
+        else:
+            self.send_static(*reply)
+
+    def do_HEAD(self):
+        reply = route_static(self.path, self.command, self.headers.get, not self.close_connection)
+        if reply is None:
+            self.wfile.write(RESPONSES[b"HEAD", not self.close_connection])
+        else:
+            self.send_static(*reply)
+
+    def send_static(self, head_bytes, body, file_range):
+        self.wfile.write(head_bytes)
+        if body is not None:
+            self.wfile.write(body)
+        elif file_range is not None:
+            path, offset, length = file_range
+            # Zero-copy: the kernel moves file pages straight to the socket
+            with open(path, "rb") as f:
+                while length > 0:
+                    sent = os.sendfile(self.connection.fileno(), f.fileno(), offset, length)
+                    if sent == 0:
+                        # File shrank under us; the framing is now wrong, so hang up
+                        self.close_connection = True
+                        break
+                    offset += sent
+                    length -= sent
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def make_server(host, port, sock=None):
+    if sock is None:
+        return Server((host, port), Handler)
+    # Pre-forked child: serve the socket the parent already bound
+    server = Server((host, port), Handler, bind_and_activate=False)
+    server.socket.close()
+    server.socket = sock
+    return server
+
+
+def serve_threaded(host, port):
+    make_server(host, port).serve_forever()
+
+
+def serve_prefork(host, port, workers):
+    """
+    Bind once, then fork `workers` children that all accept on the same
+    socket, each with its own thread-per-connection server. The parent only
+    replaces children that die and forwards SIGTERM/SIGINT.
+    """
+    sock = socket.create_server((host, port), backlog=1024)
+    children = set()
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            try:
+                make_server(host, port, sock).serve_forever()
+            finally:
+                os._exit(0)
+        children.add(pid)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(workers):
+        spawn()
+    while children:
+        try:
+            pid, _ = os.wait()
+        except ChildProcessError:
+            break
+        children.discard(pid)
+        if not stopping:
+            spawn()
+
+
+def keep_alive_requested(version, header_block):
+    connection = b""
+    for line in header_block.split(b"\r\n"):
+        name, _, value = line.partition(b":")
+        if name.strip().lower() == b"connection":
+            connection = value.strip().lower()
+    if version == b"HTTP/1.1":
+        return connection != b"close"
+    return connection == b"keep-alive"
+
+
+def content_length(header_block):
+    for line in header_block.split(b"\r\n"):
+        name, _, value = line.partition(b":")
+        if name.strip().lower() == b"content-length":
+            return int(value.strip())
+    return 0
+
+
+def parse_headers(header_block):
+    """Case-insensitive header lookup for the asyncio engine's static path."""
+    headers = {}
+    for line in header_block.decode("latin-1").split("\r\n"):
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return lambda name: headers.get(name.lower())
+
+
+async def handle_connection(reader, writer):
+    try:
+        while True:
+            try:
+                head = await reader.readuntil(b"\r\n\r\n")
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                break
+            request_line, _, header_block = head[:-4].partition(b"\r\n")
+            parts = request_line.split()
+            if len(parts) != 3:
+                writer.write(BAD_REQUEST)
+                break
+            method, target, version = parts
+            try:
+                length = content_length(header_block)
+                if length:
+                    await reader.readexactly(length)
+            except (ValueError, asyncio.IncompleteReadError):
+                writer.write(BAD_REQUEST)
+                break
+            keep_alive = keep_alive_requested(version, header_block)
+            response = RESPONSES.get((method, keep_alive))
+            if response is None:
+                writer.write(NOT_IMPLEMENTED)
+                break
+            reply = route_static(target.decode("latin-1"), method.decode(), parse_headers(header_block), keep_alive)
+            if reply is None:
+                writer.write(response)
+            else:
+                head_bytes, body, file_range = reply
+                writer.write(head_bytes)
+                if body is not None:
+                    writer.write(body)
+                elif file_range is not None and file_range[2] > 0:
+                    path, offset, length = file_range
+                    with open(path, "rb") as f:
+                        # Uses os.sendfile when the transport supports it
+                        await asyncio.get_running_loop().sendfile(writer.transport, f, offset, length)
+            await writer.drain()
+            if not keep_alive:
+                break
+    finally:
+        writer.close()
+
+
+def serve_asyncio(host, port):
+    async def main():
+        server = await asyncio.start_server(handle_connection, host, port, backlog=1024)
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(main())
+
 
 if __name__ == "__main__":
-    HTTPServer(("", 8000), Handler).serve_forever()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--engine", choices=["threaded", "prefork", "asyncio"],
+                        default=os.getenv("APP_ENGINE", "threaded"))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("APP_WORKERS", os.cpu_count() or 1)),
+                        help="processes for the prefork engine")
+    parser.add_argument("--host", default=os.getenv("APP_HOST", ""))
+    parser.add_argument("--port", type=int, default=int(os.getenv("APP_PORT", 8000)))
+    args = parser.parse_args()
+
+    print(f"Serving on port {args.port} with the {args.engine} engine", flush=True)
+    if args.engine == "prefork":
+        serve_prefork(args.host, args.port, args.workers)
+    elif args.engine == "asyncio":
+        serve_asyncio(args.host, args.port)
+    else:
+        serve_threaded(args.host, args.port)